@@ -0,0 +1,78 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.permissions import SAFE_METHODS
+
+# Маршруты роутера, чтение которых идёт через async_read_view.
+ASYNC_READ_ROUTES = (
+    'recipes-list', 'recipes-detail',
+    'tags-list', 'tags-detail',
+    'ingredients-list', 'ingredients-detail',
+    'recipes-download-shopping-cart',
+)
+
+_executor = None
+
+
+def get_executor():
+    # Пул создаётся в рабочем процессе, а не до fork в мастере gunicorn.
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_READ_THREADS,
+            thread_name_prefix='async-read'
+        )
+    return _executor
+
+
+def run_read(view, request, *args, **kwargs):
+    try:
+        response = view(request, *args, **kwargs)
+        # Ответ DRF отрисовывается здесь же, а не в общем потоке Django.
+        if hasattr(response, 'render'):
+            response.render()
+        if response.streaming:
+            # Django 3.2 перебирает потоковый ответ прямо в цикле событий,
+            # где запросы к БД запрещены: список покупок читается здесь.
+            response.streaming_content = list(response.streaming_content)
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(view):
+    """Асинхронная обёртка DRF-вида для запуска под ASGI.
+
+    Django 3.2 выполняет синхронные виды под ASGI в одном общем потоке
+    процесса, и медленный запрос задерживает все остальные. Здесь GET,
+    HEAD и OPTIONS выполняются параллельно в пуле из
+    ``ASYNC_READ_THREADS`` потоков со своими соединениями с БД; запись
+    по-прежнему идёт в общем потоке, как у обычного вида.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return await sync_to_async(view, thread_sensitive=True)(
+                request, *args, **kwargs
+            )
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            get_executor(),
+            functools.partial(
+                context.run, run_read, view, request, *args, **kwargs
+            )
+        )
+    return wrapper
+
+
+def make_async_reads(urlpatterns):
+    """Заменяет виды маршрутов ASYNC_READ_ROUTES асинхронными."""
+    for pattern in urlpatterns:
+        if pattern.name in ASYNC_READ_ROUTES:
+            pattern.callback = async_read_view(pattern.callback)
+    return urlpatterns
@@ -0,0 +1,101 @@
+import hashlib
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска: без регистра, «ё» как «е»."""
+    return value.strip().casefold().replace('ё', 'е')
+
+
+class _Snapshot:
+    """Неизменяемый снимок справочника ингредиентов.
+
+    ``keys`` - нормализованные названия в отсортированном порядке,
+    ``text`` - те же ключи через перевод строки для поиска подстрок,
+    ``offsets`` - смещение начала каждого ключа в ``text``,
+    ``version`` - хеш содержимого снимка для ETag.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: (normalize(row['name']),
+                                             row['name'], row['id']))
+        self.rows = rows
+        self.keys = [normalize(row['name']) for row in rows]
+        self.text = '\n'.join(self.keys)
+        self.offsets = []
+        offset = 0
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + 1
+        self.version = hashlib.md5(repr(
+            [tuple(row.values()) for row in rows]
+        ).encode()).hexdigest()
+
+    def search(self, query):
+        if not query:
+            return self.rows
+        start = bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(query):
+            end += 1
+        found = list(self.rows[start:end])
+        position = self.text.find(query)
+        while position != -1:
+            index = bisect_right(self.offsets, position) - 1
+            if not start <= index < end and position != self.offsets[index]:
+                found.append(self.rows[index])
+            # Переходим к следующему ключу, чтобы не дублировать строку.
+            next_key = (self.offsets[index + 1]
+                        if index + 1 < len(self.offsets) else len(self.text))
+            position = self.text.find(query, next_key)
+        return found
+
+
+class IngredientPrefixIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Сначала возвращаются названия, начинающиеся с запроса, затем
+    содержащие его. Индекс сбрасывается сигналами при изменении
+    ингредиентов и перечитывается не реже раза в
+    ``INGREDIENT_INDEX_TTL`` секунд, чтобы подхватить изменения
+    из других процессов и массовых загрузок.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        expired = (time.monotonic() - self._loaded_at
+                   > settings.INGREDIENT_INDEX_TTL)
+        if snapshot is not None and not expired:
+            return snapshot
+        with self._lock:
+            if self._snapshot is snapshot:
+                self._snapshot = _Snapshot(
+                    Ingredient.objects.values(
+                        'id', 'name', 'measurement_unit'
+                    )
+                )
+                self._loaded_at = time.monotonic()
+            return self._snapshot
+
+    def get_version(self):
+        return self._get_snapshot().version
+
+    def search(self, query=''):
+        return self._get_snapshot().search(normalize(query))
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.response import Response
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+ABSENT = 'absent'
+NOT_FOUND = 'not_found'
+REJECTED = 'rejected'
+
+
+class BatchIdsSerializer(serializers.Serializer):
+    """Список id объектов для пакетной операции."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE
+    )
+
+
+def lock_user(user):
+    """Блокирует строку пользователя до конца транзакции.
+
+    Все изменения избранного, корзины и подписок пользователя берут эту
+    блокировку, поэтому прочитанный в транзакции набор связей не может
+    разойтись с тем, что вставляется и удаляется, а счётчики и итоги не
+    меняются дважды.
+    """
+    list(
+        type(user)._default_manager.select_for_update()
+        .filter(pk=user.pk).values_list('pk', flat=True)
+    )
+
+
+def batch_relation(request, model, target_model, field,
+                   on_added=None, on_removed=None, rejected=(), counter=None):
+    """Добавляет (POST) или удаляет (DELETE) связи пользователя с
+    объектами из ``ids`` одной транзакцией.
+
+    ``model`` - модель связи с полями ``user`` и ``field``,
+    ``target_model`` - модель объектов, на которые ссылается ``field``.
+    ``on_added`` / ``on_removed`` вызываются с пользователем и списком
+    id, связи с которыми действительно изменились. ``counter`` - поле
+    счётчика ``target_model``, которое меняется на 1 у этих объектов
+    через ``change_count`` менеджера. Возвращает ответ с результатом по
+    каждому id.
+    """
+    serializer = BatchIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    user = request.user
+    lookup = f'{field}_id'
+    found = set(
+        target_model.objects.filter(id__in=ids).values_list('id', flat=True)
+    )
+    statuses = {
+        target_id: NOT_FOUND for target_id in ids if target_id not in found
+    }
+    with transaction.atomic():
+        lock_user(user)
+        relations = model.objects.filter(user=user, **{
+            f'{lookup}__in': found
+        })
+        present = set(relations.values_list(lookup, flat=True))
+        if request.method == 'POST':
+            changed = [
+                target_id for target_id in ids
+                if target_id in found and target_id not in present
+                and target_id not in rejected
+            ]
+            model.objects.bulk_create(
+                [model(user=user, **{lookup: target_id})
+                 for target_id in changed],
+                ignore_conflicts=True
+            )
+            callback, done, skipped, delta = on_added, ADDED, EXISTS, 1
+        else:
+            changed = [target_id for target_id in ids if target_id in present]
+            relations.filter(**{f'{lookup}__in': changed}).delete()
+            callback, done, skipped, delta = on_removed, REMOVED, ABSENT, -1
+        if changed and counter is not None:
+            target_model.objects.change_count(counter, changed, delta)
+        if changed and callback is not None:
+            callback(user, changed)
+    changed = set(changed)
+    for target_id in found:
+        if target_id in changed:
+            statuses[target_id] = done
+        elif request.method == 'POST' and target_id in rejected:
+            statuses[target_id] = REJECTED
+        else:
+            statuses[target_id] = skipped
+    return Response({
+        'results': [
+            {'id': target_id, 'status': statuses[target_id]}
+            for target_id in ids
+        ]
+    })
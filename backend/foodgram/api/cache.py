@@ -0,0 +1,83 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.dummy import DummyCache
+from django.db import transaction
+
+from foodgram.replicas import get_read_database
+
+RECIPES = 'recipes'
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def is_enabled():
+    return not isinstance(get_cache(), DummyCache)
+
+
+def get_timeout():
+    # Ответ с реплики мог не увидеть запись, уже сдвинувшую поколение:
+    # он живёт в кэше не дольше допустимого отставания реплики.
+    if get_read_database() is not None:
+        return settings.REPLICA_MAX_LAG
+    return DEFAULT_TIMEOUT
+
+
+def recipe_generation(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def _generation_key(name):
+    return f'generation:{name}'
+
+
+def get_generations(*names):
+    """Текущие номера поколений для частей ключа кэша.
+
+    Отсутствующий счётчик (новый или вытесненный из кэша) заводится
+    заново от текущего времени, чтобы не совпасть с прежними значениями.
+    """
+    cache = get_cache()
+    keys = [_generation_key(name) for name in names]
+    found = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump_now(*names):
+    """Сдвигает поколения сразу, вне транзакции.
+
+    Ответы, закэшированные со старым номером, больше не читаются и
+    вытесняются по таймауту.
+    """
+    cache = get_cache()
+    for name in names:
+        try:
+            cache.incr(_generation_key(name))
+        except ValueError:
+            # Счётчика нет - от него не зависит ни один ключ.
+            pass
+
+
+def bump(*names):
+    """Сдвигает поколения после коммита текущей транзакции."""
+    transaction.on_commit(lambda: bump_now(*names))
+
+
+def bump_recipes(*recipe_ids):
+    bump(RECIPES, *map(recipe_generation, recipe_ids))
+
+
+def make_key(*parts):
+    digest = hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+    return f'response:{digest}'
@@ -1,14 +1,108 @@
 import base64
+import binascii
 
-from django.core.files.base import ContentFile
-from rest_framework.fields import ImageField
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework.fields import Field, ImageField
+
+from recipes.images import get_variant
+
+ORIGINAL_SIZE = 'original'
 
 
 class Base64ImageField(ImageField):
+    """Картинка в base64 без полной проверки Pillow в запросе.
+
+    Строка декодируется частями во временный файл, у картинки читается
+    только заголовок. Полностью картинку открывает фоновая обработка
+    (recipes.images), она же сохраняет уменьшенные копии.
+    """
+    chunk_size = 64 * 1024
+
+    def decode(self, data, name):
+        file = TemporaryUploadedFile(
+            name, 'application/octet-stream', None, None
+        )
+        try:
+            for start in range(0, len(data), self.chunk_size):
+                # Размер части кратен 4, поэтому части декодируются
+                # независимо.
+                chunk = data[start:start + self.chunk_size]
+                file.write(base64.b64decode(chunk, validate=True))
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_image')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+        if not (isinstance(data, str) and data.startswith('data:image')):
+            return super().to_internal_value(data)
+        format, imgstr = data.split(';base64,')
+        ext = format.split('/')[-1]
+        file = self.decode(imgstr, 'temp.' + ext)
+        if file.size > settings.IMAGE_MAX_UPLOAD_SIZE:
+            file.close()
+            self.fail('invalid_image')
+        try:
+            with Image.open(file) as image:
+                file.content_type = Image.MIME.get(image.format)
+        except (OSError, Image.DecompressionBombError):
+            file.close()
+            self.fail('invalid_image')
+        file.seek(0)
+        return file
+
+
+class RecipeImageField(Field):
+    """Ссылка на копию картинки рецепта выбранного размера.
+
+    Размер берётся из параметра ``image_size`` запроса (один из
+    ``IMAGE_SIZE_CLASSES`` или ``original``), иначе - размер по
+    умолчанию для эндпоинта.
+    """
+
+    def __init__(self, default_size='medium', **kwargs):
+        self.default_size = default_size
+        kwargs.setdefault('source', '*')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_size(self):
+        request = self.context.get('request')
+        size = request and request.query_params.get('image_size')
+        if size == ORIGINAL_SIZE or size in settings.IMAGE_SIZE_CLASSES:
+            return size
+        return self.default_size
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        size = self.get_size()
+        name = None
+        if size != ORIGINAL_SIZE:
+            name = get_variant(recipe, settings.IMAGE_SIZE_CLASSES[size])
+        return self.get_url(name or recipe.image.name)
+
+
+class RecipeImageSrcsetField(RecipeImageField):
+    """Готовые копии картинки в виде {формат: значение srcset}."""
 
-        return super().to_internal_value(data)
+    def to_representation(self, recipe):
+        return {
+            name: ', '.join(
+                f'{self.get_url(files[width])} {width}w'
+                for width in sorted(files, key=int)
+            )
+            for name, files in recipe.image_variants.items()
+        }
@@ -1,35 +1,112 @@
+import re
+
 import django_filters
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, TrigramSimilarity
+)
+from django.db import connections
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef, Q,
+                              Value, When)
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe, Tag
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+
+TAGS_ANY = 'any'
+TAGS_ALL = 'all'
+
 
+class RecipeOrderingFilter(filters.OrderingFilter):
+    """Сортировка, дополненная (-pub_date, -id) для устойчивых страниц.
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+    Порядок совпадает с индексом ``recipe_favorites_count_idx``.
+    """
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        ordering = [self.get_ordering_value(param) for param in value]
+        return qs.order_by(*ordering, '-pub_date', '-id')
 
 
 class RecipeFilter(django_filters.FilterSet):
+    """Фильтры списка рецептов.
+
+    Связи проверяются подзапросами EXISTS, а не JOIN: любое сочетание
+    фильтров остаётся одним запросом без дублей и без DISTINCT.
+    """
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='get_tags'
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=((TAGS_ANY, 'Любой из тегов'), (TAGS_ALL, 'Все теги')),
+        method='get_tags_mode'
     )
     is_favorited = filters.BooleanFilter(method='get_favorite', )
     is_in_shopping_cart = filters.BooleanFilter(method='get_shoppingcart', )
+    search = filters.CharFilter(method='get_search')
+    ordering = RecipeOrderingFilter(fields=('favorites_count',))
 
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'author', 'tags', 'is_in_shopping_cart')
+        # ordering последним, чтобы перекрывать сортировку поиска.
+        fields = ('is_favorited', 'author', 'tags', 'tags_mode',
+                  'is_in_shopping_cart', 'search', 'ordering')
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        links = Recipe.tags.through.objects.filter(recipe=OuterRef('pk'))
+        if self.form.cleaned_data.get('tags_mode') == TAGS_ALL:
+            for tag in value:
+                queryset = queryset.filter(Exists(links.filter(tag=tag)))
+            return queryset
+        return queryset.filter(Exists(links.filter(tag__in=value)))
+
+    def get_tags_mode(self, queryset, name, value):
+        # Режим учитывается в get_tags.
+        return queryset
+
+    def filter_by_user(self, queryset, model, value):
+        if not value:
+            return queryset
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )))
 
     def get_favorite(self, queryset, name, value):
-        if value:
-            return Recipe.objects.filter(
-                favorite__user=self.request.user
-            )
-        return Recipe.objects.all()
+        return self.filter_by_user(queryset, Favorite, value)
 
     def get_shoppingcart(self, queryset, name, value):
-        if value:
-            return Recipe.objects.filter(shoppingcart__user=self.request.user)
-        return Recipe.objects.all()
+        return self.filter_by_user(queryset, ShoppingCart, value)
+
+    def get_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        if connections[queryset.db].vendor == 'postgresql':
+            query = SearchQuery(value, config='russian',
+                                search_type='websearch')
+            return queryset.annotate(
+                rank=SearchRank(F('search_vector'), query),
+                similarity=TrigramSimilarity('name', value),
+            ).filter(
+                Q(search_vector=query) | Q(name__trigram_similar=value)
+            ).order_by('-rank', '-similarity', '-pub_date')
+        # На SQLite нет полнотекстового поиска: ищем подстроку,
+        # совпадения в названии выше совпадений в описании.
+        pattern = re.escape(value)
+        return queryset.filter(
+            Q(name__iregex=pattern) | Q(text__iregex=pattern)
+        ).annotate(
+            rank=Case(
+                When(name__iregex=pattern, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        ).order_by('-rank', '-pub_date')
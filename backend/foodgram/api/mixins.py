@@ -0,0 +1,154 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+
+from . import cache
+
+CONDITIONAL_HEADERS = ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+# Заголовки ответа, которые хранятся в кэше вместе с телом.
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Vary')
+
+
+def is_conditional(request):
+    return any(header in request.META for header in CONDITIONAL_HEADERS)
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы (ETag / Last-Modified) для list и retrieve.
+
+    Наследник реализует ``get_validators``, которая дёшево, без
+    сериализации, возвращает части ETag и время изменения. Если клиент
+    прислал совпадающие If-None-Match / If-Modified-Since, ответ 304
+    отдаётся без обращения к сериализатору.
+    """
+
+    def get_validators(self, request):
+        """Возвращает (части ETag, время изменения) или (None, None)."""
+        return None, None
+
+    def needs_validators(self, request):
+        """Считать ли валидаторы для запроса; по умолчанию - всегда."""
+        return True
+
+    def make_etag(self, request, parts):
+        # В ETag входит формат ответа и пользователь: тело для JSON и
+        # браузерного API, как и флаги is_favorited, у всех разные.
+        parts = (
+            request.accepted_renderer.format,
+            request.user.pk,
+            self.action,
+            *parts
+        )
+        digest = hashlib.md5(
+            '|'.join(map(str, parts)).encode()
+        ).hexdigest()
+        return quote_etag(digest)
+
+    def conditional(self, handler, request, *args, **kwargs):
+        if not self.needs_validators(request):
+            return handler(request, *args, **kwargs)
+        parts, last_modified = self.get_validators(request)
+        if parts is None:
+            return handler(request, *args, **kwargs)
+        etag = self.make_etag(request, parts)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+
+class AnonymousCacheMixin:
+    """Кэш ответов list и retrieve для анонимных пользователей.
+
+    Ключ собирается из нормализованных параметров запроса из
+    ``cache_query_params`` и номеров поколений данных, от которых
+    зависит ответ (см. ``api.cache``). Изменение рецепта сдвигает
+    поколение списка и этого рецепта, остальные записи остаются
+    действительными.
+
+    Вместе с телом хранятся ETag и Last-Modified ответа: попадание в кэш
+    отвечает на условный запрос без обращения к базе.
+    """
+    cache_query_params = ()
+    cache_list_generations = ()
+    cache_detail_generations = ()
+
+    def get_cache_generations(self):
+        if self.action == 'retrieve':
+            return (
+                cache.recipe_generation(self.kwargs[self.lookup_field]),
+                *self.cache_detail_generations
+            )
+        return self.cache_list_generations
+
+    def get_cache_key(self, request):
+        # Порядок параметров и значений не влияет на ответ.
+        params = sorted(
+            (name, tuple(sorted(values)))
+            for name, values in request.query_params.lists()
+            if name in self.cache_query_params
+        )
+        return cache.make_key(
+            self.basename,
+            self.action,
+            request.accepted_renderer.format,
+            request.get_host(),
+            self.kwargs.get(self.lookup_field),
+            params,
+            cache.get_generations(*self.get_cache_generations()),
+        )
+
+    def will_cache(self, request):
+        """Попадёт ли ответ на запрос в кэш."""
+        return request.user.is_anonymous and cache.is_enabled()
+
+    def cached(self, handler, request, *args, **kwargs):
+        if not self.will_cache(request):
+            return handler(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        entry = cache.get_cache().get(key)
+        if entry is not None:
+            data, headers = entry
+            response = get_conditional_response(
+                request,
+                etag=headers.get('ETag'),
+                last_modified=parse_http_date_safe(
+                    headers.get('Last-Modified', '')
+                )
+            ) or Response(data)
+            for header, value in headers.items():
+                response[header] = value
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            headers = {
+                header: response[header]
+                for header in CACHED_HEADERS if response.has_header(header)
+            }
+            cache.get_cache().set(
+                key, (response.data, headers), cache.get_timeout()
+            )
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,147 @@
+import base64
+import json
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RecipePagination(PageNumberPagination):
+    """Постраничная пагинация с опциональным режимом курсора.
+
+    Если в запросе передан параметр ``cursor`` (в том числе пустой),
+    страницы выбираются от новых рецептов к старым по неизменному ключу
+    ``-id`` без COUNT и OFFSET, поэтому не сдвигаются при добавлении и
+    правке рецептов. Сортировка и поиск задают другой порядок, поэтому
+    вместе с курсором запрещены.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+    cursor_conflict_message = 'Нельзя использовать вместе с cursor.'
+    cursor_conflicts = ('ordering', 'search')
+    cursor_mode = False
+
+    def is_cursor_mode(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.is_cursor_mode(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.check_cursor_params(request)
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        position, backwards = self.decode_cursor(request)
+        results = self.get_cursor_page(
+            queryset, position, backwards, page_size + 1, view
+        )
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if backwards:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page_results = results
+        return results
+
+    def check_cursor_params(self, request):
+        errors = {
+            param: [self.cursor_conflict_message]
+            for param in self.cursor_conflicts
+            if request.query_params.get(param)
+        }
+        if errors:
+            raise ValidationError(errors)
+
+    def filter_cursor(self, queryset, position, backwards, id_field='id'):
+        """Выборка в порядке страниц, начиная после рецепта ``position``.
+
+        ``id_field`` - поле с id рецепта, если ``queryset`` выбирает
+        не сами рецепты.
+        """
+        if backwards:
+            ordering, after = id_field, 'gt'
+        else:
+            ordering, after = f'-{id_field}', 'lt'
+        queryset = queryset.order_by(ordering)
+        if position is None:
+            return queryset
+        return queryset.filter(**{f'{id_field}__{after}': position})
+
+    def get_cursor_page(self, queryset, position, backwards, size, view):
+        return list(self.filter_cursor(queryset, position, backwards)[:size])
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if self.cursor_mode:
+            return self.get_cursor_link(self.has_next, -1, False)
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.cursor_mode:
+            return self.get_cursor_link(self.has_previous, 0, True)
+        return super().get_previous_link()
+
+    def get_cursor_link(self, exists, index, backwards):
+        if not exists or not self.page_results:
+            return None
+        recipe = self.page_results[index]
+        # Страница из .values() при RECIPE_FAST_READ - словари.
+        recipe_id = recipe['id'] if isinstance(recipe, dict) else recipe.id
+        cursor = base64.urlsafe_b64encode(json.dumps({
+            'i': recipe_id,
+            'b': backwards,
+        }).encode()).decode()
+        url = remove_query_param(self.base_url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            recipe_id = int(cursor['i'])
+            backwards = bool(cursor['b'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        return recipe_id, backwards
+
+
+class FeedPagination(RecipePagination):
+    """Курсорная пагинация ленты подписок, всегда без COUNT и OFFSET.
+
+    id рецептов страницы читаются из источников
+    ``view.get_feed_sources()``: каждый отдаёт не больше страницы по
+    своему индексу, id сливаются, и только рецепты страницы загружаются
+    из переданной выборки.
+    """
+
+    def is_cursor_mode(self, request):
+        return True
+
+    def get_cursor_page(self, queryset, position, backwards, size, view):
+        recipe_ids = set()
+        for source, id_field in view.get_feed_sources():
+            recipe_ids.update(self.filter_cursor(
+                source, position, backwards, id_field
+            ).values_list(id_field, flat=True)[:size])
+        recipe_ids = sorted(recipe_ids, reverse=not backwards)[:size]
+        return list(self.filter_cursor(
+            queryset.filter(id__in=recipe_ids), None, backwards
+        ))
@@ -0,0 +1,127 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+SHOPPING_LIST_TITLE = 'Список покупок:'
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Строки списка отдаются генератором ``stream``, чтобы ответ можно было
+    передать в ``StreamingHttpResponse`` без сборки файла в памяти.
+    """
+    charset = 'utf-8'
+    filename = 'shopping_list'
+
+    def stream(self, items, title=SHOPPING_LIST_TITLE):
+        raise NotImplementedError
+
+    def get_content_type(self):
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+    def get_filename(self):
+        return f'{self.filename}.{self.format}'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            # Ошибки (например, 401) отдаются в том же формате.
+            title = str(data.get('detail', data))
+            return b''.join(self.stream([], title=title))
+        return b''.join(self.stream(data))
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, items, title=SHOPPING_LIST_TITLE):
+        yield f'{title}\n\n'.encode(self.charset)
+        for item in items:
+            yield (
+                f'{item["name"]}, {item["amount"]} '
+                f'{item["measurement_unit"]}\n'
+            ).encode(self.charset)
+
+
+class _Echo:
+    """Файлоподобный объект, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, items, title=SHOPPING_LIST_TITLE):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        ).encode(self.charset)
+        for item in items:
+            yield writer.writerow(
+                (item['name'], item['amount'], item['measurement_unit'])
+            ).encode(self.charset)
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    line_height = 18
+    margin = 50
+    chunk_size = 64 * 1024
+
+    def get_font(self):
+        font_path = settings.SHOPPING_LIST_PDF_FONT
+        if font_path and os.path.exists(font_path):
+            if self.font_name not in pdfmetrics.getRegisteredFontNames():
+                pdfmetrics.registerFont(TTFont(self.font_name, font_path))
+            return self.font_name
+        return 'Helvetica'
+
+    def stream(self, items, title=SHOPPING_LIST_TITLE):
+        # reportlab пишет документ целиком при save(), поэтому PDF
+        # собирается в буфер и отдаётся частями.
+        buffer = io.BytesIO()
+        font = self.get_font()
+        width, height = A4
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        pdf.setFont(font, self.font_size)
+        y = height - self.margin
+        pdf.drawString(self.margin, y, title)
+        y -= self.line_height * 2
+        for item in items:
+            if y < self.margin:
+                pdf.showPage()
+                pdf.setFont(font, self.font_size)
+                y = height - self.margin
+            pdf.drawString(
+                self.margin, y,
+                f'{item["name"]}, {item["amount"]} '
+                f'{item["measurement_unit"]}'
+            )
+            y -= self.line_height
+        pdf.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(self.chunk_size), b'')
+
+
+SHOPPING_LIST_RENDERERS = (
+    ShoppingListTextRenderer,
+    ShoppingListCSVRenderer,
+    ShoppingListPDFRenderer,
+)
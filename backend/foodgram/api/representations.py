@@ -0,0 +1,175 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import Http404
+from rest_framework.response import Response
+
+from recipes.images import get_variant
+from recipes.models import Recipe, RecipeIngredient, Tag
+from .fields import ORIGINAL_SIZE
+
+RECIPE_VALUES = (
+    'id', 'name', 'text', 'cooking_time', 'image', 'image_variants',
+    'image_status', 'pub_date', 'author_id', 'author__email',
+    'author__username', 'author__first_name', 'author__last_name',
+    'is_favorited', 'is_in_shopping_cart', 'author_is_subscribed',
+)
+
+
+class RecipeRepresentation:
+    """Собирает ответ RecipeSerializer из строк ``.values()``.
+
+    Результат совпадает с сериализатором до байта: те же ключи в том же
+    порядке, те же типы, те же ссылки на картинки. Теги и ингредиенты
+    страницы читаются двумя запросами и раскладываются по словарям.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        size = request.query_params.get('image_size')
+        if size != ORIGINAL_SIZE and size not in settings.IMAGE_SIZE_CLASSES:
+            size = 'medium'
+        self.size = size
+        self.urls = {}
+
+    def values(self, queryset):
+        return queryset.prefetch_related(None).values(*RECIPE_VALUES)
+
+    def get_url(self, name):
+        url = self.urls.get(name)
+        if url is None:
+            url = self.request.build_absolute_uri(default_storage.url(name))
+            self.urls[name] = url
+        return url
+
+    def get_image(self, row):
+        if not row['image']:
+            return None
+        name = None
+        if self.size != ORIGINAL_SIZE:
+            width = str(settings.IMAGE_SIZE_CLASSES[self.size])
+            name = row['image_variants'].get('jpeg', {}).get(width)
+            if name is None:
+                # Недостающая копия готовой картинки создаётся как в
+                # RecipeImageField и попадает в srcset.
+                recipe = Recipe(
+                    id=row['id'], image=row['image'],
+                    image_variants=row['image_variants'],
+                    image_status=row['image_status']
+                )
+                name = get_variant(recipe, int(width))
+                row['image_variants'] = recipe.image_variants
+        return self.get_url(name or row['image'])
+
+    def get_srcset(self, row):
+        return {
+            name: ', '.join(
+                f'{self.get_url(files[width])} {width}w'
+                for width in sorted(files, key=int)
+            )
+            for name, files in row['image_variants'].items()
+        }
+
+    def get_tags(self, recipe_ids):
+        tags = {
+            tag['id']: tag
+            for tag in Tag.objects.values('id', 'name', 'color', 'slug')
+        }
+        by_recipe = defaultdict(list)
+        links = Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('tag_id').values_list('recipe_id', 'tag_id')
+        for recipe_id, tag_id in links:
+            by_recipe[recipe_id].append(tags[tag_id])
+        return by_recipe
+
+    def get_ingredients(self, recipe_ids):
+        by_recipe = defaultdict(list)
+        rows = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('id').values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount'
+        )
+        for recipe_id, ingredient_id, name, unit, amount in rows:
+            by_recipe[recipe_id].append({
+                'id': ingredient_id,
+                'name': name,
+                'measurement_unit': unit,
+                'amount': amount,
+            })
+        return by_recipe
+
+    def build(self, rows):
+        recipe_ids = [row['id'] for row in rows]
+        tags = self.get_tags(recipe_ids)
+        ingredients = self.get_ingredients(recipe_ids)
+        return [
+            {
+                'id': row['id'],
+                'tags': tags[row['id']],
+                'author': {
+                    'email': row['author__email'],
+                    'id': row['author_id'],
+                    'username': row['author__username'],
+                    'first_name': row['author__first_name'],
+                    'last_name': row['author__last_name'],
+                    'is_subscribed': row['author_is_subscribed'],
+                },
+                'ingredients': ingredients[row['id']],
+                'is_favorited': row['is_favorited'],
+                'is_in_shopping_cart': row['is_in_shopping_cart'],
+                'name': row['name'],
+                'image': self.get_image(row),
+                'image_srcset': self.get_srcset(row),
+                'text': row['text'],
+                'cooking_time': row['cooking_time'],
+            }
+            for row in rows
+        ]
+
+
+class FastRecipeReadMixin:
+    """Чтение рецептов без сериализаторов при ``RECIPE_FAST_READ``.
+
+    Список и детальная страница собираются RecipeRepresentation, запись
+    и остальные действия идут через сериализаторы как обычно.
+    """
+
+    def get_recipes_response(self, queryset):
+        """Ответ со страницей рецептов из уже отфильтрованной выборки."""
+        if not settings.RECIPE_FAST_READ:
+            page = self.paginate_queryset(queryset)
+            if page is None:
+                return Response(self.get_serializer(queryset, many=True).data)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        representation = RecipeRepresentation(self.request)
+        rows = representation.values(queryset)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(representation.build(list(rows)))
+        return self.get_paginated_response(representation.build(page))
+
+    def list(self, request, *args, **kwargs):
+        return self.get_recipes_response(
+            self.filter_queryset(self.get_queryset())
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.RECIPE_FAST_READ:
+            return super().retrieve(request, *args, **kwargs)
+        representation = RecipeRepresentation(request)
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        try:
+            rows = list(representation.values(
+                self.filter_queryset(self.get_queryset()).filter(
+                    **{self.lookup_field: self.kwargs[lookup]}
+                )
+            ))
+        except (TypeError, ValueError):
+            rows = None
+        if not rows:
+            raise Http404
+        return Response(representation.build(rows)[0])
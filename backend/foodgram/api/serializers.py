@@ -1,10 +1,16 @@
 import re
+
+from django.db import transaction
 from rest_framework import serializers
 
 from recipes.models import (Tag, Recipe, Ingredient,
-                            RecipeIngredient, Favorite, ShoppingCart)
+                            RecipeIngredient, Favorite, ShoppingCart,
+                            ShoppingCartIngredient, TimelineEntry)
+from recipes.images import delete_variants, schedule_image_processing
+from recipes.signals import shopping_lists_updated_by_caller
 from users.serializers import CustomUserSerializer
-from .fields import Base64ImageField
+from .fields import (Base64ImageField, RecipeImageField,
+                     RecipeImageSrcsetField)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -42,7 +48,8 @@ class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для получения рецептов."""
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
-    image = Base64ImageField()
+    image = RecipeImageField(default_size='medium')
+    image_srcset = RecipeImageSrcsetField()
     ingredients = RecipeIngredientSerializer(
         many=True,
         source='recipeingredient_set'
@@ -55,26 +62,36 @@ class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'image_srcset',
+                  'text', 'cooking_time')
 
     def get_ingredients(self, obj):
         ingredients = RecipeIngredient.objects.filter(recipe=obj)
         return RecipeIngredientSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
         return Favorite.objects.filter(user=request.user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
         return ShoppingCart.objects.filter(
             user=request.user, recipe=obj).exists()
 
+    def to_representation(self, instance):
+        # Флаг подписки на автора приходит аннотацией из RecipeViewSet.
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецептов."""
@@ -111,11 +128,22 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     'Масса ингредиента должна быть больше нуля.'
                 )
+        existing = set(Ingredient.objects.filter(
+            id__in=ingredients_list
+        ).values_list('id', flat=True))
+        missing = [
+            str(ingredient_id) for ingredient_id in ingredients_list
+            if ingredient_id not in existing
+        ]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {", ".join(missing)}.'
+            )
         return data
 
     def validate_tags(self, data):
         if not data:
-            return serializers.ValidationError(
+            raise serializers.ValidationError(
                 'Необходимо выбрать тег.'
             )
         return data
@@ -130,13 +158,66 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return data
 
     def add_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            RecipeIngredient.objects.create(
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
                 ingredient_id=ingredient.get('ingredient')['id'],
                 recipe=recipe,
                 amount=ingredient.get('amount'),
             )
+            for ingredient in ingredients
+        ])
+
+    def update_ingredients(self, ingredients, recipe):
+        """Приводит ингредиенты рецепта к переданным, меняя только
+        отличающиеся строки. Возвращает изменения количеств
+        {id ингредиента: разница}."""
+        current = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        amounts = {
+            ingredient.get('ingredient')['id']: ingredient.get('amount')
+            for ingredient in ingredients
+        }
+        created, updated, delta = [], [], {}
+        for ingredient_id, amount in amounts.items():
+            row = current.get(ingredient_id)
+            if row is None:
+                created.append(RecipeIngredient(
+                    ingredient_id=ingredient_id, recipe=recipe, amount=amount
+                ))
+                delta[ingredient_id] = amount
+            elif row.amount != amount:
+                delta[ingredient_id] = amount - row.amount
+                row.amount = amount
+                updated.append(row)
+        removed = current.keys() - amounts.keys()
+        for ingredient_id in removed:
+            delta[ingredient_id] = -current[ingredient_id].amount
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        if updated:
+            RecipeIngredient.objects.bulk_update(updated, ['amount'])
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
+        return delta
+
+    def save(self, **kwargs):
+        image = self.validated_data.get('image')
+        recipe = super().save(**kwargs)
+        if image is not None:
+            # Временный файл загрузки хранилище уже переместило.
+            image.close()
+            # Обработка могла уже заменить картинку: в ответ идёт её
+            # текущее состояние, а не удалённый оригинал.
+            recipe.refresh_from_db(
+                fields=('image', 'image_status', 'image_variants')
+            )
+        return recipe
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         ingredients = validated_data.pop('recipeingredient_set')
@@ -144,16 +225,44 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=author, **validated_data)
         self.add_ingredients(ingredients, recipe)
         recipe.tags.set(tags)
+        TimelineEntry.objects.fan_out(recipe)
+        schedule_image_processing(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        tags = self.initial_data.get('tags')
-        instance.tags.set(tags)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        ingredients = validated_data.get('recipeingredient_set')
-        self.add_ingredients(ingredients, instance)
+        image = validated_data.pop('image', None)
+        for field in ('name', 'text', 'cooking_time'):
+            if field in validated_data:
+                setattr(instance, field, validated_data[field])
+        if image is not None:
+            # Копии прежней картинки больше не нужны; читаются под
+            # блокировкой, чтобы не пропустить дописанные запросом.
+            old_variants = Recipe.objects.select_for_update().filter(
+                pk=instance.pk
+            ).values_list('image_variants', flat=True).get()
+            transaction.on_commit(lambda: delete_variants(old_variants))
+            instance.image = image
+            instance.image_status = Recipe.IMAGE_PENDING
+            instance.image_variants = {}
+        # При PATCH связи, которых нет в запросе, не трогаем.
+        if 'tags' in validated_data:
+            instance.tags.set(validated_data['tags'])
+        if 'recipeingredient_set' in validated_data:
+            with shopping_lists_updated_by_caller():
+                delta = self.update_ingredients(
+                    validated_data['recipeingredient_set'], instance
+                )
+                if delta:
+                    ShoppingCartIngredient.objects.apply(
+                        instance.shoppingcart.values_list(
+                            'user_id', flat=True
+                        ),
+                        delta
+                    )
         instance.save()
+        if image is not None:
+            schedule_image_processing(instance)
         return instance
 
     # def get_is_favorited(self, obj):
@@ -176,10 +285,15 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
 class FavoriteSerializer(serializers.ModelSerializer):
     """Сериализатор для избранного."""
+    id = serializers.PrimaryKeyRelatedField(source='recipe.id', read_only=True)
+    name = serializers.CharField(source='recipe.name', read_only=True)
+    image = RecipeImageField(source='recipe', default_size='small')
+    image_srcset = RecipeImageSrcsetField(source='recipe')
+    cooking_time = serializers.IntegerField(source='recipe.cooking_time', read_only=True)
 
     class Meta:
         model = Favorite
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
 
     def validate(self, data):
         request = self.context.get('request')
@@ -195,11 +309,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
 
 class ShoppingCartSerializer(FavoriteSerializer):
     """Сериализатор для списка покупок."""
-    id = serializers.PrimaryKeyRelatedField(source='recipe.id', read_only=True)
-    name = serializers.CharField(source='recipe.name', read_only=True)
-    image = Base64ImageField(source='recipe.image', read_only=True)
-    cooking_time = serializers.IntegerField(source='recipe.cooking_time', read_only=True)
 
     class Meta:
         model = ShoppingCart
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
@@ -0,0 +1,50 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import CatalogVersion, Ingredient, Recipe, Tag
+from users.models import CustomUser
+from . import cache
+from .autocomplete import ingredient_index
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+    CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+    cache.bump(cache.INGREDIENTS)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(**kwargs):
+    CatalogVersion.objects.bump(CatalogVersion.TAGS)
+    cache.bump(cache.TAGS)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_cache(instance, **kwargs):
+    cache.bump_recipes(instance.pk)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_cache(instance, action, reverse, pk_set,
+                                 **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Изменены рецепты тега: pk_set - id рецептов (None при clear).
+        if pk_set is None:
+            cache.bump(cache.TAGS)
+        else:
+            cache.bump_recipes(*pk_set)
+    else:
+        cache.bump_recipes(instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_author_cache(instance, update_fields, **kwargs):
+    # Вход пользователя обновляет только last_login, в ответах его нет.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    cache.bump_recipes(*Recipe.objects.filter(
+        author=instance
+    ).values_list('id', flat=True))
@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.http import parse_http_date
+
+from recipes.images import process_recipe_image
+from recipes.models import CatalogVersion, Recipe
+from .utils import NO_RESPONSE_CACHE, RecipeReadTestCase
+
+RESPONSE_CACHE = {
+    **NO_RESPONSE_CACHE,
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'conditional-tests',
+    },
+}
+
+
+class RecipeConditionalGetTests(RecipeReadTestCase):
+    """ETag и Last-Modified рецепта считаются одним запросом и только
+    там, где они нужны."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.recipes[1]
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def test_no_validators_without_conditional_request(self):
+        response = self.get(self.client, self.url)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_authenticated_if_none_match(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(CACHES=RESPONSE_CACHE)
+    def test_cached_response_keeps_validators(self):
+        response = self.get(self.anonymous, self.url)
+        with self.assertNumQueries(0):
+            cached = self.get(self.anonymous, self.url)
+            not_modified = self.anonymous.get(
+                self.url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_image_processing_changes_validators(self):
+        hour_ago = timezone.now() - timedelta(hours=1)
+        Recipe.objects.filter(pk=self.recipe.pk).update(pub_date=hour_ago)
+        CatalogVersion.objects.update(updated_at=hour_ago)
+        before = self.anonymous.get(self.url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertTrue(
+            process_recipe_image(self.recipe.id, self.recipe.image.name)
+        )
+        response = self.anonymous.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=before['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], before['ETag'])
+        self.assertGreater(
+            parse_http_date(response['Last-Modified']),
+            parse_http_date(before['Last-Modified'])
+        )
@@ -0,0 +1,35 @@
+from django.test import override_settings
+
+from .utils import RecipeReadTestCase
+
+
+class RecipeFastReadTests(RecipeReadTestCase):
+    """Быстрый путь отдаёт те же байты, что и сериализаторы."""
+
+    def test_same_responses(self):
+        urls = [
+            '/api/recipes/',
+            '/api/recipes/?page=2',
+            '/api/recipes/?cursor=',
+            '/api/recipes/?image_size=original',
+            '/api/recipes/?ordering=-favorites_count',
+            f'/api/recipes/?tags={self.tags[1].slug}&tags_mode=all',
+            *(f'/api/recipes/{recipe.id}/' for recipe in self.recipes[:4]),
+        ]
+        cases = [(self.anonymous, url) for url in urls] + [
+            (self.client, url) for url in urls + [
+                '/api/recipes/feed/',
+                '/api/recipes/?is_favorited=1',
+                '/api/recipes/?is_in_shopping_cart=1',
+            ]
+        ]
+        for client, url in cases:
+            with self.subTest(url=url, anonymous=client is self.anonymous):
+                # Первый запрос создаёт копии картинок, чтобы второй путь
+                # не читал уже изменённые данные.
+                self.get(client, url)
+                with override_settings(RECIPE_FAST_READ=False):
+                    slow = self.get(client, url)
+                with override_settings(RECIPE_FAST_READ=True):
+                    fast = self.get(client, url)
+                self.assertEqual(slow.content, fast.content)
@@ -0,0 +1,76 @@
+import random
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import QueryDict
+
+from api.filters import TAGS_ALL, TAGS_ANY
+from api.pagination import RecipePagination
+from .utils import RecipeReadTestCase, Reference
+
+
+class RecipeTagFilterTests(RecipeReadTestCase):
+    """Фильтры списка на случайных сочетаниях совпадают с наивной
+    фильтрацией в Python."""
+    cases = 200
+
+    def setUp(self):
+        super().setUp()
+        # Все подходящие рецепты - на первой странице.
+        patcher = mock.patch.object(
+            RecipePagination, 'page_size', self.recipes_count
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_params(self, rng):
+        params = QueryDict(mutable=True)
+        slugs = [tag.slug for tag in self.tags]
+        params.setlist('tags', rng.sample(slugs, rng.randint(1, len(slugs))))
+        if rng.random() < 0.8:
+            params['tags_mode'] = rng.choice((TAGS_ANY, TAGS_ALL))
+        if rng.random() < 0.3:
+            params['author'] = rng.choice((self.author.id, self.other.id))
+        for name in ('is_favorited', 'is_in_shopping_cart'):
+            if rng.random() < 0.3:
+                params[name] = rng.choice(('0', '1'))
+        return params
+
+    def test_matches_reference(self):
+        rng = random.Random(0)
+        reference = Reference()
+        for _ in range(self.cases):
+            params = self.make_params(rng)
+            client, user = rng.choice((
+                (self.anonymous, AnonymousUser()),
+                (self.client, self.reader),
+            ))
+            with self.subTest(params=params.urlencode(), user=str(user)):
+                response = self.get(
+                    client, f'/api/recipes/?{params.urlencode()}'
+                )
+                self.assertEqual(
+                    sorted(item['id'] for item in response.json()['results']),
+                    reference.filter(user, params)
+                )
+
+    def test_all_is_subset_of_any(self):
+        rng = random.Random(1)
+        slugs = [tag.slug for tag in self.tags]
+        for _ in range(20):
+            chosen = rng.sample(slugs, rng.randint(1, len(slugs)))
+            found = {}
+            for mode in (TAGS_ANY, TAGS_ALL):
+                params = QueryDict(mutable=True)
+                params.setlist('tags', chosen)
+                params['tags_mode'] = mode
+                response = self.get(
+                    self.anonymous, f'/api/recipes/?{params.urlencode()}'
+                )
+                found[mode] = {
+                    item['id'] for item in response.json()['results']
+                }
+            with self.subTest(tags=chosen):
+                self.assertLessEqual(found[TAGS_ALL], found[TAGS_ANY])
+                if len(chosen) == 1:
+                    self.assertEqual(found[TAGS_ALL], found[TAGS_ANY])
@@ -0,0 +1,66 @@
+import io
+import os
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+from .utils import MEDIA_ROOT, RecipeReadTestCase, make_image
+
+
+def variant_files(recipe):
+    return [
+        os.path.join(MEDIA_ROOT, name)
+        for files in recipe.image_variants.values()
+        for name in files.values()
+    ]
+
+
+@override_settings(IMAGE_WORKERS=0)
+class RecipeImageVariantsTests(RecipeReadTestCase):
+    """Копии прежней картинки удаляются, а кэш ответов сбрасывается."""
+
+    def setUp(self):
+        super().setUp()
+        # Обработка удаляет исходный файл, поэтому у каждого теста свой.
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', cooking_time=5,
+            image=make_image(), author=self.author
+        )
+
+    def process(self, recipe):
+        self.assertTrue(process_recipe_image(recipe.id, recipe.image.name))
+        recipe.refresh_from_db()
+        return variant_files(recipe)
+
+    def test_reprocessing_deletes_old_variants(self):
+        recipe = self.recipe
+        old = self.process(recipe)
+        self.assertTrue(all(map(os.path.exists, old)))
+        # Общие картинки остальных рецептов команда не трогает.
+        Recipe.objects.exclude(pk=recipe.pk).delete()
+        with mock.patch(
+                'recipes.management.commands.process_images.'
+                'invalidate_recipe') as invalidate:
+            call_command('process_images', '--all', stdout=io.StringIO())
+        invalidate.assert_any_call(recipe.id)
+        recipe.refresh_from_db()
+        new = variant_files(recipe)
+        self.assertTrue(all(map(os.path.exists, new)))
+        self.assertFalse(any(map(os.path.exists, old)))
+
+    def test_replacing_image_deletes_old_variants(self):
+        recipe = self.recipe
+        old = self.process(recipe)
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', {'image': make_image()},
+                format='multipart'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(map(os.path.exists, old)))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_status, Recipe.IMAGE_READY)
@@ -0,0 +1,75 @@
+from unittest import mock
+
+from api.pagination import RecipePagination
+from recipes.models import Recipe
+from .utils import RecipeReadTestCase
+
+
+class RecipeCursorTests(RecipeReadTestCase):
+    """Курсорные страницы идут по неизменному ключу -id."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(RecipePagination, 'page_size', 5)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def walk(self, client, url):
+        """id рецептов всех страниц вперёд и обратно от последней."""
+        forward, pages = [], []
+        while url:
+            page = self.get(client, url).json()
+            self.assertIsNone(page['count'])
+            forward += [recipe['id'] for recipe in page['results']]
+            pages.append(page)
+            url = page['next']
+        backward = []
+        url = pages[-1]['previous']
+        while url:
+            page = self.get(client, url).json()
+            backward = [recipe['id'] for recipe in page['results']] + backward
+            url = page['previous']
+        return forward, backward
+
+    def test_list_pages(self):
+        expected = sorted((recipe.id for recipe in self.recipes), reverse=True)
+        forward, backward = self.walk(self.anonymous, '/api/recipes/?cursor=')
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected[:len(backward)])
+
+    def test_edit_does_not_move_recipe(self):
+        first = self.get(self.anonymous, '/api/recipes/?cursor=').json()
+        oldest = self.recipes[0]
+        oldest.name = 'Новое название'
+        oldest.save()
+        page = self.get(self.anonymous, first['next']).json()
+        self.assertNotIn(
+            oldest.id, [recipe['id'] for recipe in first['results']]
+        )
+        self.assertNotIn(
+            first['results'][-1]['id'],
+            [recipe['id'] for recipe in page['results']]
+        )
+
+    def test_feed_pages(self):
+        expected = list(Recipe.objects.filter(
+            author=self.author
+        ).order_by('-id').values_list('id', flat=True))
+        forward, backward = self.walk(self.client, '/api/recipes/feed/')
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected[:len(backward)])
+
+    def test_ordering_and_search_rejected(self):
+        cases = (
+            (self.anonymous, '/api/recipes/?cursor=&ordering=favorites_count'),
+            (self.anonymous, '/api/recipes/?cursor=&search=Рецепт'),
+            (self.client, '/api/recipes/feed/?search=Рецепт'),
+            (self.client, '/api/recipes/feed/?ordering=favorites_count'),
+        )
+        for client, url in cases:
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 400)
+
+    def test_invalid_cursor(self):
+        response = self.anonymous.get('/api/recipes/?cursor=invalid')
+        self.assertEqual(response.status_code, 404)
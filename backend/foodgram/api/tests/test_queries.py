@@ -0,0 +1,57 @@
+from unittest import mock
+
+from django.test import override_settings
+
+from api.pagination import RecipePagination
+from .utils import RecipeReadTestCase
+
+
+class RecipeQueryCountTests(RecipeReadTestCase):
+    """Число запросов к базе не зависит от размера страницы.
+
+    Ожидания заданы парой: через сериализаторы и при RECIPE_FAST_READ,
+    которому нужен ещё запрос справочника тегов.
+    """
+
+    def assert_queries(self, client, url, expected):
+        for fast, count in zip((False, True), expected):
+            with override_settings(RECIPE_FAST_READ=fast):
+                # Первый запрос создаёт копии картинок и заполняет кэши.
+                self.get(client, url)
+                for size in (2, 6):
+                    page_size = mock.patch.object(
+                        RecipePagination, 'page_size', size
+                    )
+                    with self.subTest(url=url, size=size, fast=fast), \
+                            page_size, self.assertNumQueries(count):
+                        self.get(client, url)
+
+    def test_anonymous_list(self):
+        self.assert_queries(self.anonymous, '/api/recipes/', (4, 5))
+        self.assert_queries(self.anonymous, '/api/recipes/?cursor=', (3, 4))
+        # Фильтр проверяет slug тегов отдельным запросом.
+        self.assert_queries(
+            self.anonymous, f'/api/recipes/?tags={self.tags[0].slug}', (5, 6)
+        )
+
+    def test_authenticated_list(self):
+        self.assert_queries(self.client, '/api/recipes/', (4, 5))
+        self.assert_queries(self.client, '/api/recipes/?cursor=', (3, 4))
+        self.assert_queries(
+            self.client, '/api/recipes/?is_favorited=1', (4, 5)
+        )
+
+    def test_feed(self):
+        self.assert_queries(self.client, '/api/recipes/feed/', (4, 5))
+
+    def test_detail(self):
+        url = f'/api/recipes/{self.recipes[1].id}/'
+        # Без условного заголовка и кэша валидаторы не считаются.
+        for fast, count in ((False, 3), (True, 4)):
+            with override_settings(RECIPE_FAST_READ=fast):
+                for client in (self.anonymous, self.client):
+                    self.get(client, url)
+                    with self.subTest(fast=fast, anonymous=(
+                            client is self.anonymous)):
+                        with self.assertNumQueries(count):
+                            self.get(client, url)
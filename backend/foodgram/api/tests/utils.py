@@ -0,0 +1,144 @@
+import io
+import shutil
+import tempfile
+from collections import defaultdict
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.filters import TAGS_ALL
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import CustomUser
+
+# Кэш ответов отключается, чтобы запросы действительно доходили до видов.
+NO_RESPONSE_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class Reference:
+    """Наивная фильтрация рецептов в Python по данным, прочитанным
+    из базы целиком."""
+
+    def __init__(self):
+        self.authors = dict(Recipe.objects.values_list('id', 'author_id'))
+        self.tags = defaultdict(set)
+        for recipe_id, slug in Recipe.tags.through.objects.values_list(
+                'recipe_id', 'tag__slug'):
+            self.tags[recipe_id].add(slug)
+        self.favorites = defaultdict(set)
+        for user_id, recipe_id in Favorite.objects.values_list(
+                'user_id', 'recipe_id'):
+            self.favorites[user_id].add(recipe_id)
+        self.cart = defaultdict(set)
+        for user_id, recipe_id in ShoppingCart.objects.values_list(
+                'user_id', 'recipe_id'):
+            self.cart[user_id].add(recipe_id)
+
+    def matches(self, recipe_id, user, params):
+        if 'author' in params and (
+                self.authors[recipe_id] != int(params['author'])):
+            return False
+        slugs = set(params.getlist('tags'))
+        if slugs:
+            found = slugs & self.tags[recipe_id]
+            if params.get('tags_mode') == TAGS_ALL:
+                if found != slugs:
+                    return False
+            elif not found:
+                return False
+        for name, relation in (('is_favorited', self.favorites),
+                               ('is_in_shopping_cart', self.cart)):
+            if params.get(name) == '1' and (
+                    user.is_anonymous or recipe_id not in relation[user.id]):
+                return False
+        return True
+
+    def filter(self, user, params):
+        return sorted(
+            recipe_id for recipe_id in self.authors
+            if self.matches(recipe_id, user, params)
+        )
+
+
+def make_image():
+    content = io.BytesIO()
+    Image.new('RGB', (10, 10)).save(content, 'PNG')
+    return ContentFile(content.getvalue(), name='image.png')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CACHES=NO_RESPONSE_CACHE)
+class RecipeReadTestCase(TestCase):
+    """Общие данные: авторы, теги и рецепты с разными сочетаниями тегов,
+    избранным и списком покупок у читателя, который подписан на автора."""
+    recipes_count = 12
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.author, cls.other = [
+            CustomUser.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                first_name=name, last_name=name, password='password'
+            )
+            for name in ('reader', 'author', 'other')
+        ]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {index}', color=f'#00000{index}',
+                slug=f'tag{index}'
+            )
+            for index in range(4)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(5)
+        ]
+        cls.recipes = []
+        for index in range(cls.recipes_count):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {index}', text='Описание', cooking_time=5,
+                image=make_image(),
+                author=cls.author if index % 2 else cls.other
+            )
+            recipe.tags.set(
+                tag for number, tag in enumerate(cls.tags)
+                if index >> number & 1
+            )
+            for number, ingredient in enumerate(ingredients[:index % 4]):
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[::3]:
+            Favorite.objects.create(user=cls.reader, recipe=recipe)
+        for recipe in cls.recipes[::4]:
+            ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+
+    def setUp(self):
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        response = self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+
+    def get(self, client, url):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework import routers
 
+from .asynchronous import make_async_reads
 from .views import IngredientsViewSet, RecipeViewSet, TagViewSet
 from users.views import FollowViewSet
 
@@ -11,8 +13,12 @@ router.register(r'ingredients', IngredientsViewSet, basename='ingredients')
 router.register(r'recipes', RecipeViewSet, basename='recipes')
 router.register(r'tags', TagViewSet, basename='tags')
 
+router_urls = router.urls
+if settings.ASYNC_READ_VIEWS:
+    router_urls = make_async_reads(router_urls)
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
@@ -1,47 +1,160 @@
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import (
+    BooleanField, Exists, F, OuterRef, Prefetch, Value
+)
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status, exceptions
 from rest_framework.decorators import action
 from rest_framework.permissions import (
     IsAuthenticated, SAFE_METHODS
 )
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
-from recipes.models import Ingredient, Recipe, Tag, Favorite, ShoppingCart, RecipeIngredient
-from .filters import RecipeFilter, IngredientSearchFilter
+from recipes.models import (
+    CatalogVersion, Ingredient, Recipe, Tag, Favorite, ShoppingCart,
+    RecipeIngredient, ShoppingCartIngredient, TimelineEntry
+)
+from recipes.signals import shopping_lists_updated_by_caller
+from users.models import Follow
+from . import cache
+from .autocomplete import ingredient_index, normalize
+from .batch import batch_relation, lock_user
+from .filters import RecipeFilter
+from .mixins import AnonymousCacheMixin, ConditionalGetMixin, is_conditional
+from .pagination import FeedPagination, RecipePagination
 from .permissions import IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly
+from .renderers import SHOPPING_LIST_RENDERERS
+from .representations import FastRecipeReadMixin
 from .serializers import (
     IngredientSerializer, TagSerializer, RecipeSerializer,
     RecipeCreateSerializer, FavoriteSerializer, ShoppingCartSerializer
 )
 
 
-class IngredientsViewSet(viewsets.ModelViewSet):
+class IngredientsViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
     pagination_class = None
 
+    def get_validators(self, request):
+        if self.action == 'list':
+            # Список отдаётся из индекса в памяти: ETag - его версия и
+            # запрос в том виде, в каком его ищет индекс.
+            return (
+                ingredient_index.get_version(),
+                normalize(request.query_params.get('name', ''))
+            ), None
+        version, updated_at = CatalogVersion.objects.get_stamps(
+            CatalogVersion.INGREDIENTS
+        )[CatalogVersion.INGREDIENTS]
+        return (self.kwargs.get('pk'), version), updated_at
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self.search, request)
+
+    def search(self, request):
+        return Response(ingredient_index.search(
+            request.query_params.get('name', '')
+        ))
 
-class TagViewSet(viewsets.ModelViewSet):
+
+class TagViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
 
+    def get_validators(self, request):
+        version, updated_at = CatalogVersion.objects.get_stamps(
+            CatalogVersion.TAGS
+        )[CatalogVersion.TAGS]
+        return (self.kwargs.get('pk'), version), updated_at
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AnonymousCacheMixin, ConditionalGetMixin,
+                    FastRecipeReadMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeCreateSerializer
     permission_classes = (IsAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = PageNumberPagination
+    pagination_class = RecipePagination
+    cache_query_params = (
+        RecipePagination.page_query_param,
+        RecipePagination.cursor_query_param,
+        'image_size',
+        *RecipeFilter.base_filters,
+    )
+    cache_list_generations = (cache.RECIPES, cache.TAGS, cache.INGREDIENTS)
+    cache_detail_generations = (cache.TAGS, cache.INGREDIENTS)
+
+    def get_queryset(self):
+        queryset = Recipe.objects.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            # Порядок задан явно, чтобы совпадать с RecipeRepresentation.
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ).order_by('id')
+            ),
+        )
+        user = self.request.user
+        if user.is_anonymous:
+            false = Value(False, output_field=BooleanField())
+            return queryset.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_is_subscribed=false,
+            )
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+
+    def needs_validators(self, request):
+        # Валидаторы стоят запроса к базе: их считают для условного
+        # запроса и для ответа, который ляжет в кэш вместе с ними.
+        return is_conditional(request) or self.will_cache(request)
+
+    def get_validators(self, request):
+        if self.action != 'retrieve':
+            return None, None
+        stamps = CatalogVersion.objects.stamp_annotations(
+            CatalogVersion.TAGS, CatalogVersion.INGREDIENTS
+        )
+        recipe = self.get_queryset().filter(pk=self.kwargs['pk']).annotate(
+            **stamps
+        ).values(
+            'pub_date', 'image', 'image_status', 'image_variants',
+            'image_updated_at', 'is_favorited', 'is_in_shopping_cart',
+            'author_is_subscribed', 'author__email', 'author__username',
+            'author__first_name', 'author__last_name', *stamps
+        ).first()
+        if recipe is None:
+            return None, None
+        last_modified = max(filter(None, (
+            recipe['pub_date'], recipe['image_updated_at'],
+            recipe[f'{CatalogVersion.TAGS}_updated_at'],
+            recipe[f'{CatalogVersion.INGREDIENTS}_updated_at'],
+        )))
+        if request.user.is_authenticated:
+            # If-Modified-Since не различает пользователей, поэтому
+            # ответ с персональными флагами проверяется только по ETag.
+            last_modified = None
+        return (self.kwargs['pk'], *recipe.values()), last_modified
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -51,6 +164,44 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save()
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # Итоги всех корзин с рецептом меняются одним запросом, а не
+        # сигналом на каждую удаляемую строку корзины.
+        amounts = instance.get_ingredient_amounts()
+        with shopping_lists_updated_by_caller():
+            ShoppingCartIngredient.objects.apply(
+                instance.shoppingcart.values_list('user_id', flat=True),
+                {key: -value for key, value in amounts.items()}
+            )
+            instance.delete()
+
+    def get_feed_sources(self):
+        """Источники ключей ленты для FeedPagination: записи ленты
+        пользователя и рецепты популярных авторов из его подписок, с
+        фильтрами запроса."""
+        user = self.request.user
+        recipes = self.filter_queryset(Recipe.objects.all())
+        timeline = TimelineEntry.objects.filter(user=user)
+        if recipes.query.has_filters():
+            timeline = timeline.filter(
+                recipe__in=recipes.order_by().values('id')
+            )
+        sources = [(timeline, 'recipe_id')]
+        popular = TimelineEntry.objects.popular_authors()
+        if popular:
+            authors = list(Follow.objects.filter(
+                user=user, author__in=popular
+            ).values_list('author', flat=True))
+            if authors:
+                sources.append((recipes.filter(author__in=authors), 'id'))
+        return sources
+
+    @action(detail=False, permission_classes=[IsAuthenticated],
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        return self.get_recipes_response(self.get_queryset())
+
     @action(methods=['POST', 'DELETE'], detail=True,
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk):
@@ -60,14 +211,22 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if request.method == 'POST':
             if Favorite.objects.filter(user=user, recipe=recipe).exists():
                 raise exceptions.ValidationError('Рецепт уже в избранном')
-            favorite = Favorite.objects.create(user=user, recipe=recipe)
+            with transaction.atomic():
+                lock_user(user)
+                favorite = Favorite.objects.create(user=user, recipe=recipe)
+                Recipe.objects.change_count('favorites_count', [recipe.id], 1)
             context = {'request': request}
             serializer = FavoriteSerializer(favorite, context=context)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         if request.method == 'DELETE':
             if not favorite_list.exists():
                 raise exceptions.ValidationError('Рецепта нет в избранном')
-            favorite_list.delete()
+            with transaction.atomic():
+                lock_user(user)
+                deleted, _ = favorite_list.delete()
+                Recipe.objects.change_count(
+                    'favorites_count', [recipe.id], -deleted
+                )
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
@@ -77,7 +236,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
         user = request.user
         queryset = get_object_or_404(Recipe, pk=pk)
         if request.method == 'POST':
-            shopping_cart = ShoppingCart.objects.create(user=user, recipe=queryset)
+            with transaction.atomic():
+                lock_user(user)
+                shopping_cart = ShoppingCart.objects.create(
+                    user=user, recipe=queryset
+                )
+                Recipe.objects.change_count('in_carts_count', [queryset.id], 1)
             context = {'request': request}
             serializer = ShoppingCartSerializer(shopping_cart, context=context)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -85,32 +249,52 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if request.method == 'DELETE':
             if not shopping_cart.exists():
                 return Response(status=status.HTTP_400_BAD_REQUEST)
-            shopping_cart.delete()
+            with transaction.atomic():
+                lock_user(user)
+                deleted, _ = shopping_cart.delete()
+                if deleted:
+                    Recipe.objects.change_count(
+                        'in_carts_count', [queryset.id], -1
+                    )
             return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(methods=['get'], detail=False,
+    @action(methods=['POST', 'DELETE'], detail=False,
+            url_path='favorite', url_name='favorite-batch',
+            permission_classes=[IsAuthenticated])
+    def favorite_batch(self, request):
+        return batch_relation(
+            request, Favorite, Recipe, 'recipe', counter='favorites_count'
+        )
+
+    @action(methods=['POST', 'DELETE'], detail=False,
+            url_path='shopping_cart', url_name='shopping-cart-batch',
             permission_classes=[IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        with shopping_lists_updated_by_caller():
+            return batch_relation(
+                request, ShoppingCart, Recipe, 'recipe',
+                on_added=ShoppingCartIngredient.objects.add_recipes,
+                on_removed=ShoppingCartIngredient.objects.remove_recipes,
+                counter='in_carts_count'
+            )
+
+    @action(methods=['get'], detail=False,
+            permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request):
-        shopping_cart = ShoppingCart.objects.filter(user=self.request.user)
-        recipes = [item.recipe.id for item in shopping_cart]
-        shopping_list = RecipeIngredient.objects.filter(
-            recipe__in=recipes
+        shopping_list = ShoppingCartIngredient.objects.filter(
+            user=request.user
         ).values(
-            'ingredient'
-        ).annotate(
-            amount=Sum('amount')
+            'amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        ).order_by('name')
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(shopping_list.iterator()),
+            content_type=renderer.get_content_type()
         )
-        shopping_list_text = 'Список покупок:\n\n'
-        for item in shopping_list:
-            ingredient = Ingredient.objects.get(id=item['ingredient'])
-            amount = item['amount']
-            shopping_list_text += (
-                f'{ingredient.name}, {amount} '
-                f'{ingredient.measurement_unit}\n'
-            )
-        response = HttpResponse(shopping_list_text, content_type="text/plain")
         response['Content-Disposition'] = (
-            'attachment; filename=shopping_list.txt'
+            f'attachment; filename={renderer.get_filename()}'
         )
-
         return response
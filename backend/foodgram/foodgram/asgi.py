@@ -0,0 +1,9 @@
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+# Под ASGI чтение рецептов, тегов и ингредиентов идёт асинхронными видами.
+os.environ.setdefault('ASYNC_READ_VIEWS', 'True')
+
+application = get_asgi_application()
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Histogram, generate_latest,
+                               multiprocess)
+
+LABELS = ('route', 'method')
+
+REQUEST_DURATION = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса.',
+    LABELS + ('status',),
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Histogram(
+    'foodgram_request_db_queries',
+    'Количество запросов к БД за запрос.',
+    LABELS,
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+DB_DURATION = Histogram(
+    'foodgram_request_db_duration_seconds',
+    'Суммарное время запросов к БД за запрос.',
+    LABELS,
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+RESPONSE_SIZE = Histogram(
+    'foodgram_response_size_bytes',
+    'Размер тела ответа.',
+    LABELS,
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+
+
+_current_counter = ContextVar('query_counter', default=None)
+
+
+class QueryCounter:
+    """Счётчик запросов к БД и их времени за один HTTP-запрос."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+    @contextmanager
+    def wrap(self):
+        for connection in connections.all():
+            install_query_counter(None, connection)
+        token = _current_counter.set(self)
+        try:
+            yield
+        finally:
+            _current_counter.reset(token)
+
+    def observe(self, labels):
+        DB_QUERIES.labels(*labels).observe(self.count)
+        DB_DURATION.labels(*labels).observe(self.duration)
+
+
+def count_queries(execute, sql, params, many, context):
+    counter = _current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    # Обёртка ставится на каждое соединение: под ASGI запросы к БД идут
+    # не в потоке middleware, а счётчик доходит до них через контекст.
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def _count_streaming(content, counter, labels):
+    # Потоковый ответ читает БД уже после выхода из middleware.
+    size = 0
+    with counter.wrap():
+        for chunk in content:
+            size += len(chunk)
+            yield chunk
+    counter.observe(labels)
+    RESPONSE_SIZE.labels(*labels).observe(size)
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса по имени маршрута.
+
+    Маршрут берётся из ``resolver_match.url_name`` (``recipes-list``,
+    ``users-subscriptions``), запросы без маршрута учитываются как
+    ``unmatched``, чтобы число меток не зависело от присланных URL.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Как в MiddlewareMixin: Django вызовет __call__ как корутину.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with counter.wrap():
+            response = self.get_response(request)
+        return self.observe(
+            request, response, counter, time.perf_counter() - started
+        )
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with counter.wrap():
+            response = await self.get_response(request)
+        return self.observe(
+            request, response, counter, time.perf_counter() - started
+        )
+
+    def observe(self, request, response, counter, duration):
+        match = request.resolver_match
+        route = match.url_name if match and match.url_name else 'unmatched'
+        if route == 'metrics':
+            return response
+        labels = (route, request.method)
+        REQUEST_DURATION.labels(*labels, response.status_code).observe(
+            duration
+        )
+        if response.streaming:
+            response.streaming_content = _count_streaming(
+                response.streaming_content, counter, labels
+            )
+        else:
+            counter.observe(labels)
+            RESPONSE_SIZE.labels(*labels).observe(len(response.content))
+        return response
+
+
+def metrics(request):
+    """Метрики в текстовом формате Prometheus.
+
+    При запуске под gunicorn с ``PROMETHEUS_MULTIPROC_DIR`` значения
+    собираются из файлов всех рабочих процессов.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import (DEFAULT_DB_ALIAS, DatabaseError, InterfaceError,
+                       OperationalError, connections)
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'db_primary_pin'
+# Токены читаются из основной базы: новый токен работает сразу после
+# входа, а удалённый перестаёт работать сразу после выхода.
+PRIMARY_APPS = ('authtoken',)
+# Результат проверки старше стольких интервалов не доверяем: значит,
+# фоновая проверка остановилась.
+HEALTH_TTL_INTERVALS = 3
+
+_read_database = ContextVar('read_database', default=None)
+# Псевдоним реплики -> (время проверки, исправна ли).
+_health = {}
+_monitor = None
+_monitor_lock = threading.Lock()
+
+REPLICATION_LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+        THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+
+def get_read_database():
+    """Реплика, с которой читает текущий запрос, или None."""
+    return _read_database.get()
+
+
+@contextmanager
+def use_database(alias):
+    token = _read_database.set(alias)
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+def check_replica(alias):
+    # Отдельное соединение: проверка не трогает соединения потока
+    # и может выполняться в любом потоке.
+    connection = connections.create_connection(alias)
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(REPLICATION_LAG_SQL)
+                lag = cursor.fetchone()[0]
+            else:
+                cursor.execute('SELECT 1')
+                lag = 0
+    except DatabaseError:
+        return False
+    finally:
+        connection.close()
+    return lag is not None and lag <= settings.REPLICA_MAX_LAG
+
+
+def set_health(alias, healthy):
+    _health[alias] = (time.monotonic(), healthy)
+
+
+def refresh_health(aliases):
+    for alias in aliases:
+        set_health(alias, check_replica(alias))
+
+
+def monitor_replicas():
+    while True:
+        try:
+            refresh_health(settings.REPLICA_DATABASES)
+        except Exception:
+            logger.exception('Не удалось проверить реплики')
+        time.sleep(settings.REPLICA_CHECK_INTERVAL)
+
+
+def start_monitor():
+    """Запускает в процессе поток, который раз в
+    ``REPLICA_CHECK_INTERVAL`` секунд проверяет реплики. Запросы только
+    читают результат и не ждут соединения с недоступной репликой."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None or not _monitor.is_alive():
+            _monitor = threading.Thread(
+                target=monitor_replicas, name='replica-monitor', daemon=True
+            )
+            _monitor.start()
+
+
+def choose_replica():
+    oldest = (
+        time.monotonic()
+        - HEALTH_TTL_INTERVALS * settings.REPLICA_CHECK_INTERVAL
+    )
+    healthy = [
+        alias for alias in settings.REPLICA_DATABASES
+        if alias in _health
+        and _health[alias][1] and _health[alias][0] >= oldest
+    ]
+    return random.choice(healthy) if healthy else None
+
+
+def get_pin_cache():
+    return caches[settings.REPLICA_PIN_CACHE_ALIAS]
+
+
+def get_pin_key(request):
+    """Ключ закрепления за основной базой для клиента с токеном или
+    сессией; у анонимного клиента ключа нет."""
+    credentials = request.META.get('HTTP_AUTHORIZATION') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    digest = hashlib.sha256(credentials.encode()).hexdigest()
+    return f'replica-pin:{digest}'
+
+
+def is_pinned(request):
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+    key = get_pin_key(request)
+    return key is not None and bool(get_pin_cache().get(key))
+
+
+class ReplicaRouter:
+    """Чтение с реплики, выбранной ReplicaMiddleware для запроса;
+    запись и миграции - только в основную базу."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return get_read_database()
+
+    def db_for_write(self, model, **hints):
+        # Явно: иначе Django записал бы объект туда, откуда его прочитал.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICA_DATABASES
+
+
+class ReplicaMiddleware:
+    """Направляет GET и HEAD к видам ``REPLICA_READ_VIEWS`` на реплики.
+
+    Реплика выбирается случайно среди исправных: доступных и отстающих
+    не больше чем на ``REPLICA_MAX_LAG`` секунд. Их проверяет фоновый
+    поток раз в ``REPLICA_CHECK_INTERVAL`` секунд, а ошибка БД во время
+    запроса сразу исключает реплику до следующей проверки. Если исправных
+    нет, запрос читает основную базу.
+
+    После любого изменяющего запроса клиент следующие ``REPLICA_MAX_LAG``
+    секунд читает основную базу и видит свои изменения. Клиент с токеном
+    или сессией закрепляется ключом в кэше ``REPLICA_PIN_CACHE_ALIAS``,
+    поэтому гарантия действует и для клиентов, не хранящих cookie;
+    анонимный клиент закрепляется только cookie. Без этого кэша гарантии
+    нет, поэтому DummyCache в нём - ошибка настройки.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if isinstance(get_pin_cache(), DummyCache):
+            raise ImproperlyConfigured(
+                f'Кэш {settings.REPLICA_PIN_CACHE_ALIAS} отключён: клиенты '
+                f'с токеном не закрепятся за основной базой после записи. '
+                f'Задайте REPLICA_PIN_CACHE_BACKEND.'
+            )
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        start_monitor()
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        database = choose_replica() if self.reads_replica(request) else None
+        with use_database(database):
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        database = choose_replica() if self.reads_replica(request) else None
+        with use_database(database):
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+    def reads_replica(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if is_pinned(request):
+            return False
+        try:
+            match = resolve(
+                request.path_info, getattr(request, 'urlconf', None)
+            )
+        except Resolver404:
+            return False
+        view = getattr(match.func, 'cls', None)
+        return view is not None and (
+            f'{view.__module__}.{view.__name__}'
+            in settings.REPLICA_READ_VIEWS
+        )
+
+    def pin(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_MAX_LAG,
+                httponly=True, samesite='Lax'
+            )
+            key = get_pin_key(request)
+            if key is not None:
+                get_pin_cache().set(key, True, settings.REPLICA_MAX_LAG)
+        return response
+
+    def process_exception(self, request, exception):
+        database = get_read_database()
+        if database is not None and isinstance(
+                exception, (OperationalError, InterfaceError)):
+            set_health(database, False)
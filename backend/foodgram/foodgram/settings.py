@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'rest_framework.authtoken',
@@ -47,6 +48,9 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if os.getenv('METRICS_ENABLED', 'True') == 'True':
+    MIDDLEWARE.insert(0, 'foodgram.metrics.MetricsMiddleware')
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -79,8 +83,46 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: DB_REPLICAS=host[:port],... (для SQLite -
+# пути к файлам). С них читают GET-запросы к REPLICA_READ_VIEWS,
+# см. foodgram.replicas.
+REPLICA_DATABASES = []
+for number, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica_{number}'
+    if 'sqlite' in (DATABASES['default']['ENGINE'] or ''):
+        DATABASES[alias] = {**DATABASES['default'], 'NAME': replica}
+    else:
+        host, _, port = replica.partition(':')
+        DATABASES[alias] = {
+            **DATABASES['default'],
+            'HOST': host,
+            'PORT': port or DATABASES['default']['PORT'],
+            'OPTIONS': {'connect_timeout': 2},
+        }
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(alias)
+
+if REPLICA_DATABASES:
+    DATABASE_ROUTERS = ['foodgram.replicas.ReplicaRouter']
+    MIDDLEWARE.append('foodgram.replicas.ReplicaMiddleware')
+
+REPLICA_READ_VIEWS = (
+    'api.views.RecipeViewSet',
+    'api.views.TagViewSet',
+    'api.views.IngredientsViewSet',
+    'users.views.FollowViewSet',
+)
+# Допустимое отставание реплики в секундах; столько же после записи
+# клиент читает основную базу.
+REPLICA_MAX_LAG = int(os.getenv('REPLICA_MAX_LAG', 10))
+REPLICA_CHECK_INTERVAL = int(os.getenv('REPLICA_CHECK_INTERVAL', 5))
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Тесты маршрутизации (foodgram/tests.py) получают от раннера вторую базу.
+TEST_RUNNER = 'foodgram.test_runner.ReplicaTestRunner'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -145,3 +187,105 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+IMAGE_MAX_WIDTH = 2048
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+IMAGE_SIZE_CLASSES = {'small': 320, 'medium': 640, 'large': 1280}
+
+BATCH_MAX_SIZE = 100
+
+# locmem хранит кэш в памяти процесса: сброс после записи виден только
+# этому процессу, поэтому он годится лишь для одного процесса gunicorn
+# (GUNICORN_WORKERS=1). Для нескольких процессов нужен redis или file.
+RESPONSE_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')
+        ),
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION', 'redis://redis:6379/1'
+        ),
+    },
+    'none': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+RESPONSE_CACHE_ALIAS = 'responses'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    RESPONSE_CACHE_ALIAS: {
+        **RESPONSE_CACHE_BACKENDS[
+            os.getenv('RESPONSE_CACHE_BACKEND', 'locmem')
+        ],
+        'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', 600)),
+    },
+}
+
+# Закрепление клиентов за основной базой после записи (foodgram.replicas)
+# хранится отдельно от кэша ответов: его отключение или сброс не должны
+# отправлять клиента на реплику, которая ещё не видит его изменений.
+# По умолчанию - хранилище того же типа, что у кэша ответов.
+REPLICA_PIN_CACHE_ALIAS = 'replica_pins'
+REPLICA_PIN_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'replica_pins',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'REPLICA_PIN_CACHE_LOCATION',
+            os.path.join(BASE_DIR, 'replica_pins')
+        ),
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv(
+            'REPLICA_PIN_CACHE_LOCATION', 'redis://redis:6379/2'
+        ),
+    },
+    'none': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+CACHES[REPLICA_PIN_CACHE_ALIAS] = REPLICA_PIN_CACHE_BACKENDS[
+    os.getenv(
+        'REPLICA_PIN_CACHE_BACKEND',
+        os.getenv('RESPONSE_CACHE_BACKEND', 'locmem')
+    )
+]
+
+RECIPE_FAST_READ = os.getenv('RECIPE_FAST_READ', 'False') == 'True'
+
+# Асинхронные виды чтения (api.asynchronous). Включаются в foodgram.asgi;
+# каждый поток пула держит своё соединение с БД.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+ASYNC_READ_THREADS = int(os.getenv('ASYNC_READ_THREADS', 16))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+FEED_BACKFILL_SIZE = 100
+# Как часто пересчитывать авторов с числом подписчиков больше
+# FEED_FANOUT_LIMIT, в секундах.
+FEED_POPULAR_AUTHORS_TIMEOUT = int(
+    os.getenv('FEED_POPULAR_AUTHORS_TIMEOUT', 300)
+)
+
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
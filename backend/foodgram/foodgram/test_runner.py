@@ -0,0 +1,28 @@
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+# Вторая база SQLite в памяти, которая в foodgram.tests играет роль реплики.
+REPLICA = 'replica_test'
+
+
+class ReplicaTestRunner(DiscoverRunner):
+    """Раннер, который на время прогона добавляет базу ``REPLICA``.
+
+    Псевдоним существует только между ``setup_databases`` и
+    ``teardown_databases``, а не с момента импорта тестов.
+    """
+
+    def setup_databases(self, **kwargs):
+        connections.databases[REPLICA] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }
+        return super().setup_databases(**kwargs)
+
+    def teardown_databases(self, old_config, **kwargs):
+        try:
+            super().teardown_databases(old_config, **kwargs)
+        finally:
+            connections[REPLICA].close()
+            del connections[REPLICA]
+            del connections.databases[REPLICA]
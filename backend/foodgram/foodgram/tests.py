@@ -0,0 +1,153 @@
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Tag
+from users.models import CustomUser, Follow
+from . import replicas
+from .test_runner import REPLICA
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Маршрутизация чтения между основной тестовой базой и второй
+    базой SQLite, которая играет роль реплики. Вторую базу создаёт
+    ReplicaTestRunner."""
+    databases = {'default', REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.routing = override_settings(
+            REPLICA_DATABASES=[REPLICA],
+            DATABASE_ROUTERS=['foodgram.replicas.ReplicaRouter'],
+            MIDDLEWARE=[
+                *settings.MIDDLEWARE, 'foodgram.replicas.ReplicaMiddleware'
+            ],
+        )
+        cls.routing.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.routing.disable()
+
+    def setUp(self):
+        # Фоновая проверка не запускается: здоровье реплики задаёт тест.
+        patcher = mock.patch.object(replicas, 'start_monitor')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(replicas._health.clear)
+        self.addCleanup(caches[settings.REPLICA_PIN_CACHE_ALIAS].clear)
+        replicas.set_health(REPLICA, True)
+        # Реплику роутер не даёт очистить между тестами, очищаем сами.
+        CustomUser.objects.using(REPLICA).all().delete()
+        for alias in ('default', REPLICA):
+            Tag.objects.using(alias).all().delete()
+            Tag.objects.using(alias).create(
+                name=alias, color='#000000', slug=alias
+            )
+        self.user = self.create_user('reader')
+        self.author = self.create_user('author')
+
+    def create_user(self, username):
+        # Реплика - копия основной базы: пользователь и токен есть в обеих.
+        user = CustomUser.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            first_name=username, last_name=username, password='password'
+        )
+        token = Token.objects.create(user=user)
+        CustomUser.objects.using(REPLICA).bulk_create([user])
+        Token.objects.using(REPLICA).bulk_create([token])
+        return user
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {user.auth_token}')
+        return client
+
+    def read_tags(self, client):
+        response = client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        return [tag['slug'] for tag in response.json()]
+
+    def test_reads_from_healthy_replica(self):
+        self.assertEqual(self.read_tags(self.client_for()), [REPLICA])
+        self.assertEqual(
+            self.read_tags(self.client_for(self.user)), [REPLICA]
+        )
+
+    def test_reads_primary_without_healthy_replica(self):
+        replicas.set_health(REPLICA, False)
+        self.assertEqual(self.read_tags(self.client_for()), ['default'])
+
+    def test_ignores_outdated_health(self):
+        checked, healthy = replicas._health[REPLICA]
+        replicas._health[REPLICA] = (
+            checked - (replicas.HEALTH_TTL_INTERVALS + 1)
+            * settings.REPLICA_CHECK_INTERVAL,
+            healthy
+        )
+        self.assertIsNone(replicas.choose_replica())
+
+    def test_request_does_not_check_replicas(self):
+        replicas._health.clear()
+        with mock.patch.object(replicas, 'check_replica') as check:
+            self.assertEqual(self.read_tags(self.client_for()), ['default'])
+        check.assert_not_called()
+
+    def test_refresh_health_checks_replica(self):
+        replicas._health.clear()
+        replicas.refresh_health([REPLICA])
+        self.assertEqual(replicas.choose_replica(), REPLICA)
+
+    def test_token_client_pinned_after_write(self):
+        client = self.client_for(self.user)
+        response = client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        # Клиенты с токеном обычно не хранят cookie.
+        client.cookies.clear()
+        self.assertEqual(self.read_tags(client), ['default'])
+        self.assertEqual(
+            self.read_tags(self.client_for(self.author)), [REPLICA]
+        )
+        caches[settings.REPLICA_PIN_CACHE_ALIAS].clear()
+        self.assertEqual(self.read_tags(client), [REPLICA])
+
+    def test_cookie_client_pinned_after_write(self):
+        client = self.client_for()
+        client.post('/api/tags/')
+        self.assertIn(replicas.PIN_COOKIE, client.cookies)
+        self.assertEqual(self.read_tags(client), ['default'])
+
+    def test_pin_cache_must_be_enabled(self):
+        dummy = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        with override_settings(CACHES={
+                **settings.CACHES, settings.REPLICA_PIN_CACHE_ALIAS: dummy
+        }):
+            with self.assertRaises(ImproperlyConfigured):
+                replicas.ReplicaMiddleware(lambda request: None)
+
+    def test_pin_survives_disabled_response_cache(self):
+        dummy = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        with override_settings(CACHES={
+                **settings.CACHES, settings.RESPONSE_CACHE_ALIAS: dummy
+        }):
+            client = self.client_for(self.user)
+            client.post(f'/api/users/{self.author.id}/subscribe/')
+            client.cookies.clear()
+            self.assertEqual(self.read_tags(client), ['default'])
+
+    def test_writes_go_to_primary(self):
+        client = self.client_for(self.user)
+        client.post(f'/api/users/{self.author.id}/subscribe/')
+        for alias, exists in (('default', True), (REPLICA, False)):
+            self.assertEqual(
+                Follow.objects.using(alias).filter(user=self.user).exists(),
+                exists
+            )
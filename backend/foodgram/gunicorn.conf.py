@@ -0,0 +1,24 @@
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+# wsgi - синхронные процессы gunicorn, asgi - процессы uvicorn
+# с асинхронными видами чтения (см. foodgram/asgi.py).
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+if SERVER_MODE == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+
+
+def on_starting(server):
+    # Файлы метрик прошлого запуска не должны попасть в новые значения.
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
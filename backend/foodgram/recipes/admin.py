@@ -1,41 +1,66 @@
 from django.contrib import admin
 
+from .admin_tools import AutocompleteFilter, LargeTableAdmin
 from .models import (Favorite, Ingredient, RecipeIngredient, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingCartIngredient, Tag,
+                     count_by_recipe)
+
+
+class AuthorFilter(AutocompleteFilter):
+    field_name = 'author'
+
+
+class IngredientFilter(AutocompleteFilter):
+    field_name = 'ingredient'
+
+
+class UserFilter(AutocompleteFilter):
+    field_name = 'user'
 
 
 class IngredientsAmountInlnLine(admin.TabularInline):
     model = RecipeIngredient
     extra = 0
+    autocomplete_fields = ('ingredient',)
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'pub_date')
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ('name', 'author', 'pub_date', 'amount_favorites',
+                    'in_carts_count', 'amount_tags', 'amount_ingredients')
+    list_select_related = ('author',)
     search_fields = ('name',)
-    list_filter = ('name', 'author', 'tags', 'pub_date',)
+    list_filter = (AuthorFilter, 'tags', 'pub_date',)
+    autocomplete_fields = ('author',)
+    readonly_fields = ('favorites_count', 'in_carts_count')
     ordering = ['pub_date', 'name',]
     empty_value_display = '-пусто-'
     inlines = [IngredientsAmountInlnLine,]
 
-    @staticmethod
-    def amount_favorites(obj):
-        return obj.favorites.count()
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            tags_count=count_by_recipe(Recipe.tags.through),
+            ingredients_count=count_by_recipe(RecipeIngredient),
+        )
+
+    @admin.display(description='В избранном', ordering='favorites_count')
+    def amount_favorites(self, obj):
+        return obj.favorites_count
 
-    @staticmethod
-    def amount_tags(obj):
-        return "\n".join([i[0] for i in obj.tags.values_list('name')])
+    @admin.display(description='Тегов')
+    def amount_tags(self, obj):
+        return obj.tags_count
 
-    @staticmethod
-    def amount_ingredients(obj):
-        return "\n".join([i[0] for i in obj.ingredients.values_list('name')])
+    @admin.display(description='Ингредиентов')
+    def amount_ingredients(self, obj):
+        return obj.ingredients_count
 
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
     search_fields = ('name',)
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     ordering = ['name',]
     empty_value_display = '-пусто-'
 
@@ -47,22 +72,38 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(LargeTableAdmin):
     list_display = ('id', 'ingredient', 'recipe', 'amount')
-    search_fields = ('ingredient',)
-    list_filter = ('ingredient',)
-    ordering = ['ingredient',]
+    list_select_related = ('ingredient', 'recipe')
+    search_fields = ('ingredient__name',)
+    list_filter = (IngredientFilter,)
+    autocomplete_fields = ('ingredient',)
+    raw_id_fields = ('recipe',)
+    ordering = ['-id',]
     empty_value_display = '-пусто-'
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     list_display = ('id', 'user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    raw_id_fields = ('user', 'recipe')
     empty_value_display = '-пусто-'
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(LargeTableAdmin):
     list_display = ('id', 'user', 'recipe')
-    list_filter = ('user',)
+    list_select_related = ('user', 'recipe')
+    list_filter = (UserFilter,)
+    raw_id_fields = ('user', 'recipe')
+    empty_value_display = '-пусто-'
+
+
+@admin.register(ShoppingCartIngredient)
+class ShoppingCartIngredientAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'ingredient', 'amount')
+    list_select_related = ('user', 'ingredient')
+    autocomplete_fields = ('ingredient',)
+    raw_id_fields = ('user',)
     empty_value_display = '-пусто-'
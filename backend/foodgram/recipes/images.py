@@ -0,0 +1,249 @@
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Копия готовой картинки, которую не удалось создать, не пересоздаётся
+# в каждом запросе.
+VARIANT_RETRY_DELAY = 60 * 60
+LOCK_TIMEOUT = 60
+
+_executor = None
+
+
+def _init_worker():
+    # Рабочий процесс запущен с нуля и открывает свои соединения с БД.
+    django.setup()
+
+
+def get_executor():
+    """Пул процессов обработки картинок.
+
+    Процессы запускаются через spawn, а не fork: веб-процесс к этому
+    времени уже держит потоки (метрики, проверка реплик, пул чтения под
+    ASGI) и открытые соединения с БД, которые копия процесса унаследовала
+    бы в произвольном состоянии.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+    return _executor
+
+
+def schedule_image_processing(recipe):
+    """Ставит обработку картинки рецепта в очередь после коммита."""
+    recipe_id, image_name = recipe.pk, recipe.image.name
+
+    def submit():
+        if not settings.IMAGE_WORKERS:
+            if process_recipe_image(recipe_id, image_name):
+                invalidate_recipe(recipe_id)
+            return
+        future = get_executor().submit(
+            process_recipe_image, recipe_id, image_name
+        )
+        future.add_done_callback(
+            lambda future: _invalidate_when_done(future, recipe_id)
+        )
+
+    transaction.on_commit(submit)
+
+
+def invalidate_recipe(recipe_id):
+    from api.cache import RECIPES, bump_now, recipe_generation
+
+    bump_now(RECIPES, recipe_generation(recipe_id))
+
+
+def _invalidate_when_done(future, recipe_id):
+    # Вызывается в процессе веб-сервера: кэш ответов, в том числе
+    # locmem, сбрасывается там, где его читают, а не в рабочем процессе.
+    if (not future.cancelled() and future.exception() is None
+            and future.result()):
+        invalidate_recipe(recipe_id)
+
+
+def _encode(image, image_format, options):
+    buffer = io.BytesIO()
+    # Метаданные (EXIF, ICC, XMP) не передаются, поэтому не сохраняются.
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def _resize(image, width):
+    if image.width <= width:
+        return image
+    height = round(image.height * width / image.width)
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def _open(image_name):
+    with default_storage.open(image_name) as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image.convert('RGB')
+
+
+def _save_variant(image, base, width, name):
+    image_format, options = FORMATS[name]
+    return default_storage.save(
+        f'images/variants/{base}_{width}.{name}',
+        ContentFile(_encode(_resize(image, width), image_format, options))
+    )
+
+
+def _base_name(image_name):
+    return os.path.splitext(os.path.basename(image_name))[0]
+
+
+def build_variants(image_name):
+    """Сохраняет уменьшенные копии картинки, возвращает новое имя
+    оригинала и словарь {формат: {ширина: имя файла}}."""
+    image = _open(image_name)
+    base = _base_name(image_name)
+    original = _resize(image, settings.IMAGE_MAX_WIDTH)
+    original_name = default_storage.save(
+        f'images/{base}.jpg',
+        ContentFile(_encode(original, *FORMATS['jpeg']))
+    )
+    variants = {
+        name: {
+            str(width): _save_variant(image, base, width, name)
+            for width in settings.IMAGE_VARIANT_WIDTHS
+        }
+        for name in FORMATS
+    }
+    return original_name, variants
+
+
+def delete_variants(variants):
+    """Удаляет файлы копий из словаря {формат: {ширина: имя файла}}."""
+    for files in variants.values():
+        for name in files.values():
+            default_storage.delete(name)
+
+
+def get_variant(recipe, width, name='jpeg'):
+    """Возвращает имя файла копии картинки рецепта нужной ширины.
+
+    Пока картинка не обработана (``image_status`` не ``ready``), копий
+    нет и возвращается None: ответ ссылается на оригинал, а декодирует
+    его только фоновая обработка. Копию готовой картинки, которой нет в
+    ``image_variants`` (например, после смены ширин), создаёт первый
+    запрос, взявший блокировку; остальные до её записи получают None.
+    Неудача запоминается на ``VARIANT_RETRY_DELAY`` секунд.
+    """
+    variant = recipe.image_variants.get(name, {}).get(str(width))
+    if (variant or not recipe.image
+            or recipe.image_status != recipe.IMAGE_READY):
+        return variant
+    image_name = recipe.image.name
+    failed_key = f'image-variant-failed:{image_name}:{width}:{name}'
+    lock_key = f'image-variant-lock:{recipe.pk}'
+    if cache.get(failed_key) or not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        return None
+    try:
+        try:
+            variant = _save_variant(
+                _open(image_name), _base_name(image_name), width, name
+            )
+        except Exception:
+            logger.exception('Не удалось создать копию картинки %s',
+                             image_name)
+            cache.set(failed_key, 1, VARIANT_RETRY_DELAY)
+            return None
+        variants = _add_variant(recipe, image_name, width, name, variant)
+    finally:
+        cache.delete(lock_key)
+    if variants is None:
+        return None
+    recipe.image_variants = variants
+    return variants[name][str(width)]
+
+
+def _add_variant(recipe, image_name, width, name, variant):
+    # Копии дописываются к тем, что сейчас в базе, а не к прочитанным
+    # запросом: их могла обновить фоновая обработка.
+    with transaction.atomic():
+        variants = type(recipe).objects.select_for_update().filter(
+            pk=recipe.pk, image=image_name,
+            image_status=recipe.IMAGE_READY
+        ).values_list('image_variants', flat=True).first()
+        if variants is None or variants.get(name, {}).get(str(width)):
+            # Картинку заменили или копию уже записали - своя не нужна.
+            default_storage.delete(variant)
+            return variants
+        variants.setdefault(name, {})[str(width)] = variant
+        type(recipe).objects.filter(pk=recipe.pk).update(
+            image_variants=variants, image_updated_at=timezone.now()
+        )
+    return variants
+
+
+def process_recipe_image(recipe_id, image_name):
+    """Обрабатывает картинку рецепта в рабочем процессе.
+
+    Возвращает True, если рецепт получил новую картинку и закэшированные
+    ответы с ним нужно сбросить.
+    """
+    from .models import Recipe
+
+    recipe = Recipe.objects.filter(pk=recipe_id, image=image_name)
+    with transaction.atomic():
+        # Блокировка как в _add_variant: прежние копии не пополнятся,
+        # пока их список читается.
+        old_variants = recipe.select_for_update().values_list(
+            'image_variants', flat=True
+        ).first()
+        if old_variants is None:
+            # Рецепт удалён или картинку уже заменили.
+            return False
+        recipe.update(image_status=Recipe.IMAGE_PROCESSING)
+    try:
+        original_name, variants = build_variants(image_name)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', image_name)
+        recipe.update(
+            image_status=Recipe.IMAGE_FAILED, image_updated_at=timezone.now()
+        )
+        return False
+    updated = recipe.update(
+        image=original_name,
+        image_variants=variants,
+        image_status=Recipe.IMAGE_READY,
+        image_updated_at=timezone.now(),
+    )
+    if updated:
+        if original_name != image_name:
+            default_storage.delete(image_name)
+        delete_variants(old_variants)
+        return True
+    default_storage.delete(original_name)
+    delete_variants(variants)
+    return False
@@ -0,0 +1,150 @@
+import csv
+import io
+import os
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import CatalogVersion
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data'
+)
+
+
+class CSVLoadCommand(BaseCommand):
+    """Базовая команда пакетной загрузки справочника из CSV.
+
+    Строки читаются потоком и вставляются пачками через
+    ``bulk_create(ignore_conflicts=True)``, поэтому повторная загрузка
+    того же файла ничего не меняет. Наследники задают модель, поля
+    CSV-строки и все наборы уникальных полей модели в ``unique_keys``.
+    По первому набору строки считаются одинаковыми; новая строка,
+    совпавшая с уже загруженной по другому набору, не вставляется и
+    выводится с пометкой ``!`` - и при ``--dry-run``, и при загрузке.
+    """
+    model = None
+    catalog = None
+    fields = ()
+    unique_keys = ()
+    default_file = None
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(DATA_DIR, self.default_file),
+            help='Путь к CSV-файлу, "-" для чтения из stdin.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одной вставке.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Показать новые строки, ничего не записывая.'
+        )
+
+    def open(self, path):
+        if path == '-':
+            return io.TextIOWrapper(
+                sys.stdin.buffer, encoding='UTF-8', newline=''
+            )
+        try:
+            return open(path, 'r', encoding='UTF-8', newline='')
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть {path}: {error}')
+
+    def read_rows(self, file):
+        for row in csv.reader(file):
+            if len(row) == len(self.fields):
+                yield dict(zip(self.fields, (value.strip() for value in row)))
+
+    def get_existing_keys(self, batch):
+        """Значения каждого набора уникальных полей, которые уже есть в
+        базе у строк, похожих на строки пачки."""
+        existing = []
+        for key in self.unique_keys:
+            lookup = {
+                f'{field}__in': {row[field] for row in batch}
+                for field in key
+            }
+            existing.append(set(
+                self.model.objects.filter(**lookup).values_list(*key)
+            ))
+        return existing
+
+    def split_batch(self, batch):
+        """Делит пачку на новые строки и строки, которые совпали с уже
+        загруженными не по первому набору полей: [(строка, поля)]."""
+        existing = self.get_existing_keys(batch)
+        new, conflicts = [], []
+        for row in batch:
+            values = [
+                tuple(row[field] for field in key) for key in self.unique_keys
+            ]
+            if values[0] in existing[0]:
+                continue
+            clash = [
+                key for key, value, found
+                in zip(self.unique_keys, values, existing) if value in found
+            ]
+            if clash:
+                conflicts.append((row, clash))
+                continue
+            for value, found in zip(values, existing):
+                found.add(value)
+            new.append(row)
+        return new, conflicts
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        started = time.monotonic()
+        total = 0
+        count_before = self.model.objects.count()
+        new = 0
+        skipped = 0
+        with self.open(options['path']) as file:
+            rows = self.read_rows(file)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                total += len(batch)
+                rows_new, conflicts = self.split_batch(batch)
+                skipped += len(conflicts)
+                for row, clash in conflicts:
+                    fields = ', '.join(field for key in clash for field in key)
+                    self.stdout.write(self.style.WARNING(
+                        f'! {", ".join(row.values())} (уже есть: {fields})'
+                    ))
+                if dry_run:
+                    new += len(rows_new)
+                    for row in rows_new:
+                        self.stdout.write('+ ' + ', '.join(row.values()))
+                    continue
+                with transaction.atomic():
+                    # ignore_conflicts - для строк, которые другой процесс
+                    # вставил после проверки.
+                    self.model.objects.bulk_create(
+                        [self.model(**row) for row in rows_new],
+                        ignore_conflicts=True
+                    )
+        if not dry_run:
+            new = self.model.objects.count() - count_before
+            if new:
+                CatalogVersion.objects.bump(self.catalog)
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else total
+        action = 'будет добавлено' if dry_run else 'добавлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {total}, {action}: {new}, '
+            f'пропущено из-за совпадений: {skipped} ({rate:.0f} строк/с).'
+        ))
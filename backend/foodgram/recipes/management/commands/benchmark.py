@@ -0,0 +1,365 @@
+import io
+import json
+import math
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.cache import get_cache
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag, TimelineEntry)
+from users.models import CustomUser, Follow
+
+PERCENTILES = (50, 90, 95, 99)
+
+# (название, авторизован ли клиент, URL). В URL подставляются
+# {recipe}, {author} и {tags} из созданного набора данных.
+SCENARIOS = (
+    ('recipes-list-anon', False, '/api/recipes/'),
+    ('recipes-list-anon-deep-page', False, '/api/recipes/?page=50'),
+    ('recipes-list-anon-tags', False, '/api/recipes/?{tags}'),
+    ('recipes-list-anon-author', False, '/api/recipes/?author={author}'),
+    ('recipes-list-anon-search', False, '/api/recipes/?search=рецепт'),
+    ('recipes-list-anon-cursor', False, '/api/recipes/?cursor='),
+    ('recipes-list-anon-popular', False,
+     '/api/recipes/?ordering=-favorites_count'),
+    ('recipes-list-auth', True, '/api/recipes/'),
+    ('recipes-list-auth-favorited', True, '/api/recipes/?is_favorited=1'),
+    ('recipes-list-auth-cart', True, '/api/recipes/?is_in_shopping_cart=1'),
+    ('recipes-list-auth-tags-author', True,
+     '/api/recipes/?{tags}&author={author}'),
+    ('recipes-detail-anon', False, '/api/recipes/{recipe}/'),
+    ('recipes-detail-auth', True, '/api/recipes/{recipe}/'),
+    ('recipes-feed', True, '/api/recipes/feed/'),
+    ('users-subscriptions', True,
+     '/api/users/subscriptions/?recipes_limit=3'),
+    ('users-subscriptions-recipes-10', True,
+     '/api/users/subscriptions/?recipes_limit=10'),
+    ('download-shopping-cart-txt', True,
+     '/api/recipes/download_shopping_cart/'),
+    ('download-shopping-cart-pdf', True,
+     '/api/recipes/download_shopping_cart/?format=pdf'),
+)
+
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга."""
+    values = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа и число запросов к БД основных '
+            'эндпоинтов API на отдельной тестовой базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--follows', type=int, default=30,
+            help='Подписок у каждого пользователя.'
+        )
+        parser.add_argument(
+            '--cart-size', type=int, default=100,
+            help='Рецептов в корзине пользователя, от имени которого '
+                 'идут авторизованные запросы.'
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--repeat', type=int, default=30,
+            help='Замеров на сценарий.'
+        )
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--scenario', action='append', default=[],
+            help='Запустить только сценарии, содержащие строку.'
+        )
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Не сбрасывать кэш ответов перед каждым запросом.'
+        )
+        parser.add_argument(
+            '--output', default='benchmark.json',
+            help='Файл для результатов в JSON.'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON предыдущего запуска для сравнения.'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый рост p50/p95 относительно baseline (доля).'
+        )
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=1.0,
+            help='Меньшую разницу во времени не считать регрессией.'
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять тестовую базу после запуска.'
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='UTF-8') as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(
+                    f'Не удалось прочитать {options["baseline"]}: {error}'
+                )
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb']
+        )
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root):
+                started = time.monotonic()
+                context = self.create_dataset(options)
+                self.stdout.write(
+                    f'Данные созданы за {time.monotonic() - started:.1f} с.'
+                )
+                results = self.run_scenarios(context, options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'dataset': {
+                    name: options[name] for name in (
+                        'users', 'recipes', 'ingredients', 'tags',
+                        'follows', 'cart_size', 'seed'
+                    )
+                },
+                'repeat': options['repeat'],
+                'warm_cache': options['warm_cache'],
+            },
+            'scenarios': results,
+        }
+        with open(options['output'], 'w', encoding='UTF-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результаты записаны в {options["output"]}.')
+        if baseline is not None:
+            self.compare(baseline, report, options)
+
+    def create_dataset(self, options):
+        """Заполняет тестовую базу детерминированным набором данных."""
+        rng = random.Random(options['seed'])
+        image_name = default_storage.save('images/benchmark.jpg', ContentFile(
+            self.make_image()
+        ))
+        variants = {
+            name: {str(width): image_name
+                   for width in settings.IMAGE_VARIANT_WIDTHS}
+            for name in ('webp', 'jpeg')
+        }
+
+        CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f'user{i}', email=f'user{i}@example.com',
+                first_name='Имя', last_name='Фамилия', password='!'
+            )
+            for i in range(max(options['users'], 2))
+        ])
+        users = list(CustomUser.objects.order_by('id'))
+        Tag.objects.bulk_create([
+            Tag(name=f'Тег {i}', color=f'#{i:06X}', slug=f'tag{i}')
+            for i in range(max(options['tags'], 1))
+        ])
+        tags = list(Tag.objects.order_by('id'))
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(max(options['ingredients'], 12))
+        ])
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+
+        now = timezone.now()
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=rng.choice(users),
+                name=f'рецепт {i}',
+                text='Описание рецепта. ' * rng.randint(5, 40),
+                cooking_time=rng.randint(1, 240),
+                image=image_name,
+                image_status=Recipe.IMAGE_READY,
+                image_variants=variants,
+            )
+            for i in range(max(options['recipes'], 1))
+        ], batch_size=1000)
+        # pub_date с auto_now заполняется при вставке, а bulk_update
+        # пишет значения как есть: разносим рецепты по времени.
+        recipes = list(Recipe.objects.order_by('id').only('id'))
+        for index, recipe in enumerate(recipes):
+            recipe.pub_date = now - timedelta(minutes=index)
+        Recipe.objects.bulk_update(recipes, ['pub_date'], batch_size=1000)
+        recipe_ids = [recipe.id for recipe in recipes]
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(ingredient_ids, rng.randint(3, 12))
+        ], batch_size=5000)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag.id)
+            for recipe_id in recipe_ids
+            for tag in rng.sample(tags, rng.randint(1, min(3, len(tags))))
+        ], batch_size=5000)
+
+        follows = min(options['follows'], len(users) - 1)
+        Follow.objects.bulk_create([
+            Follow(user=user, author=author)
+            for user in users
+            for author in rng.sample(
+                [other for other in users if other != user], follows
+            )
+        ], batch_size=5000)
+        for user in users:
+            TimelineEntry.objects.backfill(user, list(
+                Follow.objects.filter(user=user).values_list(
+                    'author_id', flat=True
+                )
+            ))
+
+        Favorite.objects.bulk_create([
+            Favorite(user=user, recipe_id=recipe_id)
+            for user in users
+            for recipe_id in rng.sample(
+                recipe_ids, min(rng.randint(0, 50), len(recipe_ids))
+            )
+        ], batch_size=5000)
+        user = users[0]
+        cart = rng.sample(
+            recipe_ids, min(options['cart_size'], len(recipe_ids))
+        )
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=user, recipe_id=recipe_id)
+            for recipe_id in cart
+        ])
+        call_command('rebuild_shopping_lists', stdout=io.StringIO())
+        Recipe.objects.recount()
+
+        return {
+            'token': Token.objects.create(user=user).key,
+            'recipe': recipe_ids[len(recipe_ids) // 2],
+            'author': users[len(users) // 2].id,
+            'tags': '&'.join(f'tags={tag.slug}' for tag in tags[:2]),
+        }
+
+    def make_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), (200, 120, 40)).save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def run_scenarios(self, context, options):
+        anonymous = Client()
+        authorized = Client(HTTP_AUTHORIZATION=f'Token {context["token"]}')
+        cache = get_cache()
+        results = {}
+        for name, auth, url in SCENARIOS:
+            if options['scenario'] and not any(
+                part in name for part in options['scenario']
+            ):
+                continue
+            url = url.format(**context)
+            client = authorized if auth else anonymous
+            timings = []
+            queries = 0
+            size = 0
+            for attempt in range(options['warmup'] + options['repeat']):
+                if not options['warm_cache']:
+                    cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    if response.streaming:
+                        content = b''.join(response.streaming_content)
+                    else:
+                        content = response.content
+                    elapsed = time.perf_counter() - started
+                if response.status_code != 200:
+                    raise CommandError(
+                        f'{name}: {url} вернул {response.status_code}.'
+                    )
+                if attempt >= options['warmup']:
+                    timings.append(elapsed * 1000)
+                    queries = max(queries, len(captured.captured_queries))
+                    size = len(content)
+            results[name] = {
+                'url': url,
+                'authorized': auth,
+                'queries': queries,
+                'bytes': size,
+                'mean_ms': round(sum(timings) / len(timings), 3),
+                'min_ms': round(min(timings), 3),
+                'max_ms': round(max(timings), 3),
+                **{
+                    f'p{percent}_ms': round(percentile(timings, percent), 3)
+                    for percent in PERCENTILES
+                },
+            }
+            self.stdout.write(
+                f'{name:40} p50 {results[name]["p50_ms"]:8.2f} мс  '
+                f'p95 {results[name]["p95_ms"]:8.2f} мс  '
+                f'запросов {queries:3}'
+            )
+        return results
+
+    def compare(self, baseline, report, options):
+        """Сравнивает запуск с baseline, при регрессиях завершается
+        с ошибкой."""
+        regressions = []
+        for name, current in report['scenarios'].items():
+            previous = baseline.get('scenarios', {}).get(name)
+            if previous is None:
+                continue
+            if current['queries'] > previous['queries']:
+                regressions.append(
+                    f'{name}: запросов к БД {previous["queries"]} -> '
+                    f'{current["queries"]}'
+                )
+            for key in ('p50_ms', 'p95_ms'):
+                limit = previous[key] * (1 + options['threshold'])
+                if (current[key] > limit and current[key] - previous[key]
+                        > options['min_delta_ms']):
+                    regressions.append(
+                        f'{name}: {key} {previous[key]:.2f} -> '
+                        f'{current[key]:.2f}'
+                    )
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно baseline:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Регрессий относительно baseline нет.'
+        ))
@@ -0,0 +1,84 @@
+import random
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from api.filters import TAGS_ALL, TAGS_ANY, RecipeFilter
+from api.tests.utils import Reference
+from recipes.models import Recipe, Tag
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = ('Сверяет RecipeFilter на случайных сочетаниях фильтров с '
+            'наивной реализацией в Python.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cases', type=int, default=500,
+            help='Сколько случайных сочетаний фильтров проверить.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора сочетаний.'
+        )
+
+    def make_params(self, rng, reference, slugs):
+        params = QueryDict(mutable=True)
+        if rng.random() < 0.3:
+            params['author'] = rng.choice(list(reference.authors.values()))
+        if rng.random() < 0.7:
+            params.setlist('tags', rng.sample(
+                slugs, rng.randint(1, min(3, len(slugs)))
+            ))
+        if rng.random() < 0.6:
+            params['tags_mode'] = rng.choice((TAGS_ANY, TAGS_ALL))
+        for name in ('is_favorited', 'is_in_shopping_cart'):
+            if rng.random() < 0.4:
+                params[name] = rng.choice(('0', '1'))
+        return params
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        reference = Reference()
+        slugs = list(Tag.objects.values_list('slug', flat=True))
+        if not reference.authors or not slugs:
+            raise CommandError('Нужны рецепты и теги.')
+        user_ids = list(reference.favorites.keys() | reference.cart.keys())
+        users = list(CustomUser.objects.filter(id__in=user_ids[:50]))
+        users.append(AnonymousUser())
+        factory = RequestFactory()
+        failures = []
+        for _ in range(options['cases']):
+            params = self.make_params(rng, reference, slugs)
+            request = factory.get('/api/recipes/')
+            request.user = rng.choice(users)
+            filterset = RecipeFilter(
+                params, queryset=Recipe.objects.order_by('id'),
+                request=request
+            )
+            if not filterset.is_valid():
+                failures.append(f'{params.urlencode()}: {filterset.errors}')
+                continue
+            with CaptureQueriesContext(connection) as queries:
+                actual = list(filterset.qs.values_list('id', flat=True))
+            expected = reference.filter(request.user, params)
+            statements = [query['sql'] for query in queries.captured_queries]
+            if actual != expected or len(statements) > 1 or any(
+                    'DISTINCT' in sql for sql in statements):
+                failures.append(
+                    f'{request.user} {params.urlencode()}: '
+                    f'{actual[:10]} != {expected[:10]}, '
+                    f'запросов {len(statements)}'
+                )
+        for line in failures[:20]:
+            self.stderr.write(line)
+        if failures:
+            raise CommandError(f'Расхождений: {len(failures)}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Фильтры совпадают с эталоном на {options["cases"]} случаях.'
+        ))
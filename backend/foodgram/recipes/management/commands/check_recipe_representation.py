@@ -0,0 +1,118 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.test import APIClient
+
+from api.tests.utils import NO_RESPONSE_CACHE
+from recipes.models import Recipe
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = ('Сверяет ответы списка и страницы рецепта при RECIPE_FAST_READ '
+            'с ответами сериализаторов байт в байт.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='username пользователя для авторизованных запросов.'
+        )
+        parser.add_argument(
+            '--pages', type=int, default=3,
+            help='Сколько первых страниц списка сверять.'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=20,
+            help='Сколько последних рецептов сверять по одному.'
+        )
+
+    def get_urls(self, options):
+        urls = []
+        for page in range(1, options['pages'] + 1):
+            urls.append(f'/api/recipes/?page={page}')
+        urls += [
+            '/api/recipes/?cursor=',
+            '/api/recipes/?image_size=small',
+            '/api/recipes/?image_size=original&page=2',
+            '/api/recipes/?search=а',
+            '/api/recipes/?ordering=-favorites_count&page=2',
+        ]
+        recipe_ids = Recipe.objects.values_list(
+            'id', flat=True
+        )[:options['recipes']]
+        urls += [f'/api/recipes/{recipe_id}/' for recipe_id in recipe_ids]
+        urls.append('/api/recipes/0/')
+        return urls
+
+    def get_cases(self, options):
+        """Пары (клиент, URL): аноним и, если задан, пользователь."""
+        urls = self.get_urls(options)
+        cases = [('anonymous', APIClient(), url) for url in urls]
+        if options['user']:
+            try:
+                user = CustomUser.objects.get(username=options['user'])
+            except CustomUser.DoesNotExist:
+                raise CommandError(
+                    f'Пользователь {options["user"]} не найден.'
+                )
+            client = APIClient()
+            client.force_authenticate(user)
+            cases += [
+                (user.username, client, url)
+                for url in urls + [
+                    '/api/recipes/feed/',
+                    '/api/recipes/?is_favorited=1',
+                    '/api/recipes/?is_in_shopping_cart=1',
+                ]
+            ]
+        return cases
+
+    def fetch(self, client, url, fast):
+        with override_settings(RECIPE_FAST_READ=fast,
+                               CACHES=NO_RESPONSE_CACHE):
+            started = time.process_time()
+            response = client.get(url)
+            return response, time.process_time() - started
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            mismatches, checked, slow_total, fast_total = self.compare(
+                options
+            )
+        finally:
+            teardown_test_environment()
+        for line in mismatches:
+            self.stderr.write(line)
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}.')
+        speedup = slow_total / fast_total if fast_total else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Ответы совпадают: {checked}. CPU: сериализаторы '
+            f'{slow_total * 1000:.0f} мс, быстрый путь '
+            f'{fast_total * 1000:.0f} мс ({speedup:.1f}x).'
+        ))
+
+    def compare(self, options):
+        mismatches = []
+        checked = 0
+        slow_total = fast_total = 0.0
+        for name, client, url in self.get_cases(options):
+            # Первый запрос создаёт недостающие копии картинок, чтобы
+            # второй путь не читал уже изменённые данные.
+            self.fetch(client, url, False)
+            slow, slow_time = self.fetch(client, url, False)
+            fast, fast_time = self.fetch(client, url, True)
+            slow_total += slow_time
+            fast_total += fast_time
+            checked += 1
+            if (slow.status_code, slow.content) != (
+                    fast.status_code, fast.content):
+                mismatches.append(
+                    f'{name} {url}: {slow.status_code} '
+                    f'{slow.content[:200]!r} != {fast.status_code} '
+                    f'{fast.content[:200]!r}'
+                )
+        return mismatches, checked, slow_total, fast_total
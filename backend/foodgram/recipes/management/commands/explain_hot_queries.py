@@ -0,0 +1,209 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingCartIngredient, Tag, TimelineEntry)
+from users.models import CustomUser, Follow
+from .benchmark import SCENARIOS
+from .check_recipe_representation import NO_RESPONSE_CACHE
+
+# Таблицы, растущие вместе с числом пользователей: читать их можно
+# только через индекс.
+LARGE_MODELS = (
+    CustomUser, Follow, Recipe, Recipe.tags.through, RecipeIngredient,
+    Favorite, ShoppingCart, ShoppingCartIngredient, TimelineEntry,
+)
+# Сценарии, которым сортировка нужна по смыслу (ранг поиска).
+SORTING_SCENARIOS = ('recipes-list-anon-search',)
+# Узлы, которые читают всех потомков до первой строки результата:
+# Limit выше них не сокращает чтение.
+BLOCKING_NODES = (
+    'Sort', 'Aggregate', 'Hash', 'Materialize', 'WindowAgg', 'SetOp',
+)
+INDEX_SCANS = ('Index Scan', 'Index Only Scan')
+DECLARE_CURSOR = re.compile(r'^DECLARE .+? CURSOR .*?FOR (SELECT .*)$', re.S)
+
+
+def walk(plan, limit=float('inf')):
+    """Узлы плана EXPLAIN (FORMAT JSON) в глубину вместе с оценкой
+    числа строк, которые из узла будут прочитаны с учётом Limit выше."""
+    if plan['Node Type'] == 'Limit':
+        limit = min(limit, plan['Plan Rows'])
+    elif plan['Node Type'] in BLOCKING_NODES:
+        limit = float('inf')
+    yield plan, min(plan['Plan Rows'], limit)
+    for child in plan.get('Plans', ()):
+        yield from walk(child, limit)
+
+
+def find_problems(plan, tables, sort_rows, max_rows):
+    problems = []
+    for node, rows in walk(plan):
+        node_type = node['Node Type']
+        relation = node.get('Relation Name')
+        if node_type == 'Seq Scan' and relation in tables:
+            problems.append(f'Seq Scan по {relation}')
+        elif (node_type in INDEX_SCANS and relation in tables
+                and 'Index Cond' not in node and rows > max_rows):
+            problems.append(
+                f'{node_type} по всему индексу {node["Index Name"]} '
+                f'(~{rows:.0f} строк)'
+            )
+        elif (node_type.endswith('Scan') and relation in tables
+                and rows > max_rows):
+            problems.append(f'{node_type} по {relation} (~{rows:.0f} строк)')
+        elif node_type in ('Sort', 'Incremental Sort'):
+            # Sort читает весь вход, а Incremental Sort досортировывает
+            # уже упорядоченные группы и под Limit читает только нужные.
+            sorted_rows = node['Plan Rows'] if node_type == 'Sort' else rows
+            if sorted_rows > sort_rows:
+                keys = ', '.join(node.get('Sort Key', ()))
+                problems.append(
+                    f'{node_type} по {keys} (~{sorted_rows:.0f} строк)'
+                )
+    return problems
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN для запросов горячих эндпоинтов на '
+            'заполненной базе PostgreSQL и падает, если план читает '
+            'большую таблицу или её индекс целиком, оценивает чтение '
+            'слишком большого числа строк или сортирует много строк.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='username пользователя для авторизованных сценариев; '
+                 'по умолчанию - пользователь с самым большим избранным.'
+        )
+        parser.add_argument(
+            '--scenario', action='append', default=[],
+            help='Проверить только сценарии, содержащие строку.'
+        )
+        parser.add_argument(
+            '--sort-rows', type=int, default=1000,
+            help='Сортировка меньшего числа строк не считается ошибкой.'
+        )
+        parser.add_argument(
+            '--max-rows', type=int, default=10000,
+            help='Сколько строк одной большой таблицы может прочитать '
+                 'запрос по оценке планировщика.'
+        )
+        parser.add_argument(
+            '--no-seqscan',
+            action='store_true',
+            help='Запретить планировщику последовательное чтение: тогда '
+                 'Seq Scan в плане значит, что подходящего индекса нет '
+                 'вовсе. По умолчанию проверяется план, который '
+                 'PostgreSQL выберет и в работе.'
+        )
+
+    def get_user(self, username):
+        if username:
+            user = CustomUser.objects.filter(username=username).first()
+        else:
+            top = Favorite.objects.order_by().values('user').annotate(
+                total=Count('id')
+            ).order_by('-total').first()
+            user = None
+            if top is not None:
+                user = CustomUser.objects.get(id=top['user'])
+        if user is None:
+            raise CommandError('Нет пользователя для авторизованных '
+                               'сценариев: заполните базу seed_dataset.')
+        return user
+
+    def get_context(self):
+        recipe = Recipe.objects.order_by('-pub_date', 'id').first()
+        author = Recipe.objects.order_by().values('author').annotate(
+            total=Count('id')
+        ).order_by('-total').first()
+        tags = Tag.objects.order_by('id')[:2]
+        if recipe is None or not tags:
+            raise CommandError('База пуста: заполните её seed_dataset.')
+        return {
+            'recipe': recipe.id,
+            'author': author['author'],
+            'tags': '&'.join(f'tags={tag.slug}' for tag in tags),
+        }
+
+    def capture(self, client, url):
+        # Первый запрос заполняет кэши процесса (популярные авторы ленты,
+        # индекс ингредиентов): проверяются запросы установившегося режима.
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        statements = []
+        for query in queries.captured_queries:
+            sql = query['sql']
+            match = DECLARE_CURSOR.match(sql)
+            if match:
+                sql = match.group(1)
+            if sql.startswith('SELECT') and sql not in statements:
+                statements.append(sql)
+        return response.status_code, statements
+
+    def explain(self, sql, no_seqscan):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if no_seqscan:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+            return cursor.fetchone()[0][0]['Plan']
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Планы проверяются только на PostgreSQL.')
+        tables = {model._meta.db_table for model in LARGE_MODELS}
+        anonymous = APIClient()
+        authorized = APIClient()
+        authorized.force_authenticate(self.get_user(options['user']))
+        context = self.get_context()
+        failures = 0
+        setup_test_environment()
+        try:
+            for name, auth, url in SCENARIOS:
+                if options['scenario'] and not any(
+                    part in name for part in options['scenario']
+                ):
+                    continue
+                with override_settings(CACHES=NO_RESPONSE_CACHE):
+                    status, statements = self.capture(
+                        authorized if auth else anonymous,
+                        url.format(**context)
+                    )
+                problems = [] if status == 200 else [f'ответ {status}']
+                for sql in statements:
+                    plan = self.explain(sql, options['no_seqscan'])
+                    found = find_problems(
+                        plan, tables,
+                        float('inf') if name in SORTING_SCENARIOS
+                        else options['sort_rows'],
+                        options['max_rows']
+                    )
+                    problems += [f'{problem}: {sql[:300]}'
+                                 for problem in found]
+                if problems:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(name))
+                    for problem in problems:
+                        self.stdout.write(f'  {problem}')
+                else:
+                    self.stdout.write(
+                        f'{name}: {len(statements)} запросов, индексы '
+                        f'используются'
+                    )
+        finally:
+            teardown_test_environment()
+        if failures:
+            raise CommandError(f'Сценариев с проблемными планами: {failures}.')
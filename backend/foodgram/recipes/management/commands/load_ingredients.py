@@ -1,18 +1,11 @@
-from csv import reader
+from recipes.models import CatalogVersion, Ingredient
+from ._loader import CSVLoadCommand
 
-from django.core.management.base import BaseCommand
-from recipes.models import Ingredient
 
-
-class Command(BaseCommand):
-
-    def handle(self, *args, **kwargs):
-        with open(
-                'recipes/data/ingredients.csv', 'r',
-                encoding='UTF-8'
-        ) as ingredients:
-            for row in reader(ingredients):
-                if len(row) == 2:
-                    Ingredient.objects.get_or_create(
-                        name=row[0], measurement_unit=row[1],
-                    )
\ No newline at end of file
+class Command(CSVLoadCommand):
+    help = 'Загружает ингредиенты из CSV: название, единица измерения.'
+    model = Ingredient
+    catalog = CatalogVersion.INGREDIENTS
+    fields = ('name', 'measurement_unit')
+    unique_keys = (('name', 'measurement_unit'),)
+    default_file = 'ingredients.csv'
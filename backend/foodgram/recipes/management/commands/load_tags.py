@@ -1,17 +1,11 @@
-from csv import reader
-from django.core.management.base import BaseCommand
-from recipes.models import Tag
+from recipes.models import CatalogVersion, Tag
+from ._loader import CSVLoadCommand
 
 
-class Command(BaseCommand):
-
-    def handle(self, *args, **kwargs):
-        with open(
-                'recipes/data/recipes_tag.csv', 'r',
-                encoding='UTF-8'
-        ) as tags:
-            for row in reader(tags):
-                if len(row) == 3:
-                    Tag.objects.get_or_create(
-                        name=row[0], color=row[1], slug=row[2],
-                    )
+class Command(CSVLoadCommand):
+    help = 'Загружает теги из CSV: название, цвет, слаг.'
+    model = Tag
+    catalog = CatalogVersion.TAGS
+    fields = ('name', 'color', 'slug')
+    unique_keys = (('slug',), ('name',), ('color',))
+    default_file = 'recipes_tag.csv'
@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+from collections import Counter
+from http.client import HTTPException
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from .benchmark import PERCENTILES, SCENARIOS, percentile
+from .explain_hot_queries import Command as ExplainCommand
+
+
+class Command(BaseCommand):
+    help = ('Нагружает запущенный сервер параллельными запросами '
+            'сценариев benchmark и выводит пропускную способность и '
+            'процентили времени ответа. Данные для URL берутся из той же '
+            'базы, с которой работает сервер.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument(
+            '--concurrency', type=int, default=32,
+            help='Число одновременных клиентов.'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность нагрузки в секундах.'
+        )
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument(
+            '--user',
+            help='username пользователя для авторизованных сценариев; '
+                 'по умолчанию - пользователь с самым большим избранным.'
+        )
+        parser.add_argument(
+            '--scenario', action='append', default=[],
+            help='Использовать только сценарии, содержащие строку.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def get_requests(self, options):
+        explain = ExplainCommand()
+        context = explain.get_context()
+        token, _ = Token.objects.get_or_create(
+            user=explain.get_user(options['user'])
+        )
+        requests = []
+        for name, auth, url in SCENARIOS:
+            if options['scenario'] and not any(
+                part in name for part in options['scenario']
+            ):
+                continue
+            headers = {'Authorization': f'Token {token.key}'} if auth else {}
+            requests.append(
+                (name, options['url'].rstrip('/') + quote(
+                    url.format(**context), safe='/?&=:'
+                ), headers)
+            )
+        if not requests:
+            raise CommandError('Нет сценариев для нагрузки.')
+        return requests
+
+    def client(self, number, requests, deadline, options, results):
+        rng = random.Random(options['seed'] + number)
+        timings = []
+        statuses = Counter()
+        while time.monotonic() < deadline:
+            name, url, headers = rng.choice(requests)
+            started = time.perf_counter()
+            try:
+                with urlopen(Request(url, headers=headers),
+                             timeout=options['timeout']) as response:
+                    response.read()
+                    status = response.status
+            except HTTPError as error:
+                status = error.code
+            except (URLError, HTTPException, OSError) as error:
+                status = type(error).__name__
+            timings.append((time.perf_counter() - started) * 1000)
+            statuses[status] += 1
+        results[number] = (timings, statuses)
+
+    def handle(self, *args, **options):
+        requests = self.get_requests(options)
+        results = {}
+        started = time.monotonic()
+        deadline = started + options['duration']
+        threads = [
+            threading.Thread(
+                target=self.client,
+                args=(number, requests, deadline, options, results)
+            )
+            for number in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        timings = [value for part, _ in results.values() for value in part]
+        statuses = sum(
+            (part for _, part in results.values()), Counter()
+        )
+        if not timings:
+            raise CommandError('Ни один запрос не завершился.')
+        errors = sum(
+            count for status, count in statuses.items() if status != 200
+        )
+        self.stdout.write(
+            f'{len(timings)} запросов за {elapsed:.1f} с, '
+            f'{len(timings) / elapsed:.1f} запросов/с, '
+            f'{options["concurrency"]} клиентов'
+        )
+        self.stdout.write(', '.join(
+            f'p{percent} {percentile(timings, percent):.0f} мс'
+            for percent in PERCENTILES
+        ) + f', max {max(timings):.0f} мс')
+        self.stdout.write(f'Ошибок: {errors} {dict(statuses)}')
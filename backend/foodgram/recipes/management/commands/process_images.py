@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import invalidate_recipe, process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Обрабатывает картинки рецептов, которые ещё не обработаны '
+            'или обработка которых завершилась ошибкой.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Обработать заново картинки всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if not options['all']:
+            recipes = recipes.exclude(image_status=Recipe.IMAGE_READY)
+        processed = 0
+        for recipe_id, image_name in recipes.values_list(
+            'id', 'image'
+        ).iterator():
+            if process_recipe_image(recipe_id, image_name):
+                # Как после обработки из запроса: закэшированные ответы
+                # ссылаются на прежние копии.
+                invalidate_recipe(recipe_id)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {processed}.'
+        ))
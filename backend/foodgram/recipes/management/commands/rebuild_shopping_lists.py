@@ -0,0 +1,114 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from recipes.models import (RecipeIngredient, ShoppingCart,
+                            ShoppingCartIngredient)
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает итоговые списки покупок пользователей '
+            'и сверяет их с полным пересчётом корзин.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить таблицу, ничего не изменяя.'
+        )
+
+    def lock(self, rebuild):
+        """Блокирует корзины и составы рецептов до конца транзакции.
+
+        Пока идут пересчёт и сверка, их нельзя изменить: иначе правка,
+        сделанная между чтением корзин и записью итогов, потерялась бы.
+        Читать таблицы можно. При пересборке итоги блокируются ещё и от
+        второй пересборки. В SQLite пишущая транзакция и так одна.
+        """
+        if connection.vendor != 'postgresql':
+            return
+        quote = connection.ops.quote_name
+        sources = ', '.join(
+            quote(model._meta.db_table)
+            for model in (ShoppingCart, RecipeIngredient)
+        )
+        totals = quote(ShoppingCartIngredient._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {sources} IN SHARE MODE')
+            cursor.execute(
+                f'LOCK TABLE {totals} IN '
+                f'{"SHARE ROW EXCLUSIVE" if rebuild else "SHARE"} MODE'
+            )
+
+    def recompute(self):
+        totals = RecipeIngredient.objects.filter(
+            recipe__shoppingcart__isnull=False
+        ).values(
+            'recipe__shoppingcart__user', 'ingredient'
+        ).annotate(
+            total=Sum('amount')
+        ).values_list('recipe__shoppingcart__user', 'ingredient', 'total')
+        return {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in totals.iterator()
+        }
+
+    def stored(self):
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingCartIngredient.objects.values_list(
+                'user', 'ingredient', 'amount'
+            ).iterator()
+        }
+
+    def diff(self, expected):
+        actual = self.stored()
+        mismatches = defaultdict(list)
+        for key in expected.keys() | actual.keys():
+            if expected.get(key) != actual.get(key):
+                mismatches[key[0]].append(key[1])
+        return mismatches
+
+    def handle(self, *args, **options):
+        if options['check']:
+            with transaction.atomic():
+                self.lock(rebuild=False)
+                expected = self.recompute()
+                mismatches = self.diff(expected)
+            if mismatches:
+                raise CommandError(
+                    f'Списки покупок расходятся с корзинами у '
+                    f'{len(mismatches)} пользователей: '
+                    f'{sorted(mismatches)[:20]}'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'Списки покупок совпадают с корзинами '
+                f'({len(expected)} строк).'
+            ))
+            return
+        with transaction.atomic():
+            self.lock(rebuild=True)
+            expected = self.recompute()
+            ShoppingCartIngredient.objects.all().delete()
+            ShoppingCartIngredient.objects.bulk_create(
+                (
+                    ShoppingCartIngredient(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount
+                    )
+                    for (user_id, ingredient_id), amount in expected.items()
+                ),
+                batch_size=1000
+            )
+            mismatches = self.diff(expected)
+        if mismatches:
+            raise CommandError(
+                'Пересобранная таблица не совпала с пересчётом.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны ({len(expected)} строк).'
+        ))
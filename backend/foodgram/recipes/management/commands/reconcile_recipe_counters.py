@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики избранного и корзин рецептов с таблицами '
+            'и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить счётчики, ничего не изменяя.'
+        )
+
+    def drifted(self):
+        return Recipe.objects.with_actual_counts().filter(
+            ~Q(favorites_count=F('actual_favorites_count'))
+            | ~Q(in_carts_count=F('actual_in_carts_count'))
+        ).order_by('id').values_list('id', flat=True)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipe_ids = list(self.drifted())
+            if recipe_ids and not options['check']:
+                Recipe.objects.filter(id__in=recipe_ids).recount()
+        if not recipe_ids:
+            self.stdout.write(self.style.SUCCESS(
+                'Счётчики рецептов совпадают с таблицами.'
+            ))
+            return
+        if options['check']:
+            raise CommandError(
+                f'Счётчики расходятся у {len(recipe_ids)} рецептов: '
+                f'{recipe_ids[:20]}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики исправлены у {len(recipe_ids)} рецептов.'
+        ))
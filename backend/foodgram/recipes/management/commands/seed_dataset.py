@@ -0,0 +1,483 @@
+import csv
+import io
+import json
+import multiprocessing
+import random
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import accumulate
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+from PIL import Image
+
+from api import cache
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingCartIngredient, Tag,
+                            TimelineEntry)
+from users.models import CustomUser, Follow
+
+RecipeTag = Recipe.tags.through
+SEED_IMAGE = 'images/seed.jpg'
+
+
+@lru_cache(maxsize=None)
+def zipf_cum_weights(n, exponent):
+    """Накопленные веса распределения Ципфа для рангов 0..n-1."""
+    return list(accumulate(1 / (rank ** exponent)
+                           for rank in range(1, n + 1)))
+
+
+def zipf_sample(rng, n, exponent, k):
+    """``k`` различных рангов из ``n`` по закону Ципфа."""
+    k = min(k, n)
+    cum_weights = zipf_cum_weights(n, exponent)
+    chosen = set()
+    # Для почти полной выборки Ципф сходится медленно - добираем
+    # оставшиеся ранги равномерно.
+    for _ in range(10):
+        if len(chosen) >= k:
+            break
+        chosen.update(rng.choices(
+            range(n), cum_weights=cum_weights, k=k - len(chosen)
+        ))
+    while len(chosen) < k:
+        chosen.add(rng.randrange(n))
+    return chosen
+
+
+def power_law(rng, alpha, low, high):
+    """Целое из распределения Парето, ограниченное [low, high]."""
+    return max(low, min(high, int(low * rng.paretovariate(alpha))))
+
+
+class Plan:
+    """Параметры генерации, общие для всех процессов.
+
+    Популярность по Ципфу привязана к рангу, а ранг переводится в id
+    перестановкой ``rank * step mod n``, чтобы популярные рецепты и
+    авторы не совпадали с первыми по id.
+    """
+
+    def __init__(self, options, first_user, first_recipe, tag_ids,
+                 ingredient_ids, image_name, now):
+        self.seed = options['seed']
+        self.users = options['users']
+        self.recipes = options['recipes']
+        self.chunk_size = options['chunk_size']
+        self.exponent = options['zipf']
+        self.follow_alpha = options['follow_alpha']
+        self.max_follows = options['max_follows']
+        self.favorites = options['favorites']
+        self.cart = options['cart']
+        self.days = options['days']
+        self.first_user = first_user
+        self.first_recipe = first_recipe
+        self.tag_ids = tag_ids
+        self.ingredient_ids = ingredient_ids
+        self.image_name = image_name
+        self.now = now
+
+    def rng(self, *parts):
+        return random.Random('|'.join(map(str, (self.seed, *parts))))
+
+    @staticmethod
+    def permute(rank, n):
+        step = 7919 if n % 7919 else 104729
+        return rank * step % n
+
+    def user_id(self, rank):
+        return self.first_user + self.permute(rank, self.users)
+
+    def recipe_id(self, rank):
+        return self.first_recipe + self.permute(rank, self.recipes)
+
+    def chunks(self, total):
+        return [
+            (start, min(start + self.chunk_size, total))
+            for start in range(0, total, self.chunk_size)
+        ]
+
+
+def generate_users(plan, start, end):
+    rng = plan.rng('users', start)
+    joined = plan.now - timedelta(days=plan.days)
+    users = []
+    for index in range(start, end):
+        user_id = plan.first_user + index
+        users.append({
+            'id': user_id,
+            'username': f'seed{user_id}',
+            'email': f'seed{user_id}@example.com',
+            'first_name': 'Имя',
+            'last_name': 'Фамилия',
+            'password': '!',
+            'date_joined': joined + timedelta(
+                seconds=rng.randrange(plan.days * 86400)
+            ),
+        })
+    return {CustomUser._meta.label: users}
+
+
+def generate_recipes(plan, start, end):
+    rng = plan.rng('recipes', start)
+    variants = {
+        name: {str(width): plan.image_name
+               for width in settings.IMAGE_VARIANT_WIDTHS}
+        for name in ('webp', 'jpeg')
+    }
+    recipes, tags, ingredients = [], [], []
+    # Число рецептов у автора подчиняется закону Ципфа.
+    author_ranks = rng.choices(
+        range(plan.users),
+        cum_weights=zipf_cum_weights(plan.users, plan.exponent),
+        k=end - start
+    )
+    for index, author_rank in zip(range(start, end), author_ranks):
+        recipe_id = plan.first_recipe + index
+        recipes.append({
+            'id': recipe_id,
+            'author_id': plan.user_id(author_rank),
+            'name': f'Рецепт {recipe_id}',
+            'text': 'Описание рецепта. ' * rng.randint(3, 40),
+            'cooking_time': rng.randint(1, 240),
+            'image': plan.image_name,
+            'image_status': Recipe.IMAGE_READY,
+            'image_variants': variants,
+            'pub_date': plan.now - timedelta(
+                seconds=rng.randrange(plan.days * 86400)
+            ),
+        })
+        for rank in zipf_sample(rng, len(plan.tag_ids), plan.exponent,
+                                rng.randint(1, 3)):
+            tags.append({'recipe_id': recipe_id,
+                         'tag_id': plan.tag_ids[rank]})
+        for rank in zipf_sample(rng, len(plan.ingredient_ids), plan.exponent,
+                                rng.randint(3, 12)):
+            ingredients.append({
+                'recipe_id': recipe_id,
+                'ingredient_id': plan.ingredient_ids[rank],
+                'amount': rng.randint(1, 500),
+            })
+    return {
+        Recipe._meta.label: recipes,
+        RecipeTag._meta.label: tags,
+        RecipeIngredient._meta.label: ingredients,
+    }
+
+
+def generate_activity(plan, start, end):
+    rng = plan.rng('activity', start)
+    follows, favorites, carts = [], [], []
+    for index in range(start, end):
+        user_id = plan.first_user + index
+        # Подписки: число на пользователя по Парето, авторы по Ципфу,
+        # поэтому число подписчиков у авторов - степенной хвост.
+        count = power_law(rng, plan.follow_alpha, 1, plan.max_follows)
+        authors = [
+            plan.user_id(rank) for rank in sorted(
+                zipf_sample(rng, plan.users, plan.exponent, count + 1)
+            )
+        ]
+        follows.extend(
+            {'user_id': user_id, 'author_id': author_id}
+            for author_id in [
+                author_id for author_id in authors if author_id != user_id
+            ][:count]
+        )
+        favorites_count = power_law(
+            rng, plan.follow_alpha, plan.favorites, plan.favorites * 20
+        ) if plan.favorites else 0
+        for rank in sorted(zipf_sample(rng, plan.recipes, plan.exponent,
+                                       favorites_count)):
+            favorites.append({'user_id': user_id,
+                              'recipe_id': plan.recipe_id(rank)})
+        for rank in sorted(zipf_sample(rng, plan.recipes, plan.exponent,
+                                       rng.randint(0, plan.cart))):
+            carts.append({'user_id': user_id,
+                          'recipe_id': plan.recipe_id(rank)})
+    return {
+        Follow._meta.label: follows,
+        Favorite._meta.label: favorites,
+        ShoppingCart._meta.label: carts,
+    }
+
+
+GENERATORS = {
+    'users': generate_users,
+    'recipes': generate_recipes,
+    'activity': generate_activity,
+}
+
+
+class TableWriter:
+    """Пишет строки в таблицу модели: COPY на PostgreSQL, пачки
+    INSERT на остальных СУБД.
+
+    Поля, не переданные в строках, заполняются значениями по умолчанию
+    из модели, поэтому новые NOT NULL поля с default не ломают запись.
+    """
+
+    def __init__(self, model, keys, batch_size=5000):
+        self.model = model
+        self.batch_size = batch_size
+        self.fields = [
+            field for field in model._meta.concrete_fields
+            if field.attname in keys
+            or not (field.primary_key or field.null)
+        ]
+        self.defaults = {
+            field.attname: field.get_default() for field in self.fields
+            if field.attname not in keys
+        }
+
+    def adapt(self, value):
+        if isinstance(value, datetime):
+            if connection.vendor == 'postgresql':
+                return value.isoformat()
+            return connection.ops.adapt_datetimefield_value(value)
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    def values(self, rows):
+        for row in rows:
+            yield [
+                self.adapt(row.get(field.attname,
+                                   self.defaults.get(field.attname)))
+                for field in self.fields
+            ]
+
+    def write(self, rows):
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        columns = ', '.join(
+            connection.ops.quote_name(field.column) for field in self.fields
+        )
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(self.values(rows))
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                    buffer
+                )
+                return
+            sql = (f'INSERT INTO {table} ({columns}) VALUES '
+                   f'({", ".join(["%s"] * len(self.fields))})')
+            values = list(self.values(rows))
+            for start in range(0, len(values), self.batch_size):
+                cursor.executemany(
+                    sql, values[start:start + self.batch_size]
+                )
+
+
+def write_tables(tables):
+    """Пишет {метка модели: строки} одной транзакцией."""
+    rows = 0
+    with transaction.atomic():
+        for label, table_rows in tables.items():
+            if table_rows:
+                TableWriter(
+                    apps.get_model(label), table_rows[0].keys()
+                ).write(table_rows)
+                rows += len(table_rows)
+    return rows
+
+
+def run_task(task):
+    """Генерирует часть данных и пишет её из рабочего процесса."""
+    plan, kind, start, end = task
+    return write_tables(GENERATORS[kind](plan, start, end))
+
+
+def generate_task(task):
+    """Только генерирует часть данных: запись идёт в родителе."""
+    plan, kind, start, end = task
+    return GENERATORS[kind](plan, start, end)
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу большим синтетическим набором пользователей, '
+            'рецептов, подписок, избранного и корзин.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='Минимальное число ингредиентов.')
+        parser.add_argument('--tags', type=int, default=10,
+                            help='Минимальное число тегов.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности.'
+        )
+        parser.add_argument(
+            '--follow-alpha', type=float, default=1.5,
+            help='Показатель Парето для числа подписок и избранного.'
+        )
+        parser.add_argument('--max-follows', type=int, default=500)
+        parser.add_argument(
+            '--favorites', type=int, default=5,
+            help='Минимум избранного у активных пользователей.'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=10,
+            help='Максимум рецептов в корзине пользователя.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить даты публикации.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--processes', type=int,
+            default=multiprocessing.cpu_count(),
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужно хотя бы 2 пользователя и 1 рецепт.')
+        started = time.monotonic()
+        plan = self.make_plan(options)
+        total = 0
+        # Соединения родителя не должны достаться процессам после fork.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(options['processes']) as pool:
+            for kind, count in (('users', plan.users),
+                                ('recipes', plan.recipes),
+                                ('activity', plan.users)):
+                phase_started = time.monotonic()
+                rows = self.run_phase(pool, plan, kind, count)
+                total += rows
+                self.report(kind, rows, time.monotonic() - phase_started)
+        phase_started = time.monotonic()
+        rows = self.fill_derived(plan)
+        total += rows
+        self.report('derived', rows, time.monotonic() - phase_started)
+        self.reset_sequences()
+        cache.bump(cache.RECIPES, cache.TAGS)
+        self.report('всего', total, time.monotonic() - started, success=True)
+
+    def report(self, name, rows, elapsed, success=False):
+        rate = rows / elapsed if elapsed else rows
+        message = (f'{name}: {rows} строк за {elapsed:.1f} с '
+                   f'({rate:.0f} строк/с)')
+        self.stdout.write(self.style.SUCCESS(message) if success else message)
+
+    def run_phase(self, pool, plan, kind, count):
+        tasks = [(plan, kind, start, end) for start, end in plan.chunks(count)]
+        if connection.vendor == 'postgresql':
+            return sum(pool.imap_unordered(run_task, tasks))
+        # SQLite не переносит параллельную запись: процессы генерируют
+        # данные, родитель пишет их пачками.
+        return sum(
+            write_tables(tables)
+            for tables in pool.imap(generate_task, tasks)
+        )
+
+    def make_plan(self, options):
+        self.ensure_catalog(Tag, options['tags'], lambda i: Tag(
+            name=f'Тег {i}', color=f'#{i:06X}', slug=f'seed-tag-{i}'
+        ))
+        self.ensure_catalog(Ingredient, options['ingredients'], lambda i: (
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+        ))
+        # Одна картинка на все запуски: повторный save добавил бы суффикс.
+        image_name = SEED_IMAGE
+        if not default_storage.exists(image_name):
+            buffer = io.BytesIO()
+            Image.new('RGB', (640, 480), (200, 120, 40)).save(buffer, 'JPEG')
+            image_name = default_storage.save(
+                image_name, ContentFile(buffer.getvalue())
+            )
+        # Новые id идут после существующих, чтобы не пересечься с ними.
+        first_user = (CustomUser.objects.aggregate(
+            value=Max('id'))['value'] or 0) + 1
+        first_recipe = (Recipe.objects.aggregate(
+            value=Max('id'))['value'] or 0) + 1
+        return Plan(
+            options, first_user, first_recipe,
+            list(Tag.objects.order_by('id').values_list('id', flat=True)),
+            list(Ingredient.objects.order_by('id').values_list(
+                'id', flat=True
+            )),
+            image_name,
+            timezone.now(),
+        )
+
+    def ensure_catalog(self, model, count, factory):
+        existing = model.objects.count()
+        if existing < count:
+            model.objects.bulk_create(
+                [factory(i) for i in range(existing, count)],
+                ignore_conflicts=True
+            )
+
+    def fill_derived(self, plan):
+        """Ленты подписок и итоги списков покупок новых пользователей
+        собираются одним INSERT ... SELECT на таблицу, счётчики
+        затронутых рецептов - одним UPDATE."""
+        quote = connection.ops.quote_name
+        timeline = TimelineEntry._meta.db_table
+        totals = ShoppingCartIngredient._meta.db_table
+        follow = Follow._meta.db_table
+        recipe = Recipe._meta.db_table
+        cart = ShoppingCart._meta.db_table
+        recipe_ingredient = RecipeIngredient._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(timeline)} '
+                f'(user_id, recipe_id, author_id) '
+                f'SELECT user_id, recipe_id, author_id FROM ('
+                f'SELECT f.user_id, r.id AS recipe_id, r.author_id, '
+                f'ROW_NUMBER() OVER ('
+                f'PARTITION BY f.user_id, r.author_id '
+                f'ORDER BY r.pub_date DESC, r.id DESC) AS row_number '
+                f'FROM {quote(follow)} f '
+                f'JOIN {quote(recipe)} r ON r.author_id = f.author_id '
+                f'WHERE f.user_id >= %s) ranked WHERE row_number <= %s',
+                (plan.first_user, settings.FEED_BACKFILL_SIZE)
+            )
+            rows = cursor.rowcount
+            cursor.execute(
+                f'INSERT INTO {quote(totals)} '
+                f'(user_id, ingredient_id, amount) '
+                f'SELECT c.user_id, ri.ingredient_id, SUM(ri.amount) '
+                f'FROM {quote(cart)} c '
+                f'JOIN {quote(recipe_ingredient)} ri '
+                f'ON ri.recipe_id = c.recipe_id '
+                f'WHERE c.user_id >= %s '
+                f'GROUP BY c.user_id, ri.ingredient_id',
+                (plan.first_user,)
+            )
+            rows += cursor.rowcount
+            rows += Recipe.objects.filter(
+                Exists(Favorite.objects.filter(
+                    recipe=OuterRef('pk'), user_id__gte=plan.first_user
+                ))
+                | Exists(ShoppingCart.objects.filter(
+                    recipe=OuterRef('pk'), user_id__gte=plan.first_user
+                ))
+            ).recount()
+        return rows
+
+    def reset_sequences(self):
+        # COPY с явными id не сдвигает последовательности PostgreSQL.
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [CustomUser, Recipe]
+        )
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
@@ -0,0 +1,68 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:05
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# GIN-индексы и триггер есть только в PostgreSQL, на SQLite поиск
+# выполняется без них.
+SEARCH_SQL = (
+    """
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update();
+    """,
+    'UPDATE recipes_recipe SET name = name;',
+    'CREATE INDEX recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector);',
+    'CREATE INDEX recipes_recipe_name_trgm '
+    'ON recipes_recipe USING gin (name gin_trgm_ops);',
+)
+
+DROP_SEARCH_SQL = (
+    'DROP INDEX IF EXISTS recipes_recipe_name_trgm;',
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin;',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe;',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update();',
+)
+
+
+def run_postgres_sql(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_auto_20261018_1942'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_postgres_sql(SEARCH_SQL),
+            run_postgres_sql(DROP_SEARCH_SQL),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:46
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Сводит дубли ингредиентов к записи с наименьшим id."""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartIngredient = apps.get_model(
+        'recipes', 'ShoppingCartIngredient'
+    )
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in duplicates:
+        keep = group['keep']
+        extra = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=keep)
+        for model, owner in ((RecipeIngredient, 'recipe'),
+                             (ShoppingCartIngredient, 'user')):
+            for row in model.objects.filter(ingredient__in=extra):
+                target = model.objects.filter(
+                    **{owner: getattr(row, f'{owner}_id')}, ingredient_id=keep
+                ).first()
+                if target is None:
+                    row.ingredient_id = keep
+                    row.save()
+                else:
+                    target.amount += row.amount
+                    target.save()
+                    row.delete()
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
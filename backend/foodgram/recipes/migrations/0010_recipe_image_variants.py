@@ -0,0 +1,23 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_status',
+            field=models.CharField(choices=[('pending', 'Ожидает обработки'), ('processing', 'Обрабатывается'), ('ready', 'Готова'), ('failed', 'Ошибка обработки')], default='pending', max_length=20, verbose_name='Состояние обработки картинки'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Уменьшенные копии картинки'),
+        ),
+    ]
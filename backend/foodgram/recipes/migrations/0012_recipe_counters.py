@@ -0,0 +1,48 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """Заполняет счётчики существующих рецептов."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+
+    def count(model_name):
+        model = apps.get_model('recipes', model_name)
+        return Coalesce(Subquery(
+            model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+                'recipe'
+            ).annotate(total=Count('id')).values('total')
+        ), 0)
+
+    Recipe.objects.update(
+        favorites_count=count('Favorite'),
+        in_carts_count=count('ShoppingCart'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:19
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_favorites(apps, schema_editor):
+    """Оставляет по одной записи избранного на пару пользователь-рецепт
+    и пересчитывает счётчики затронутых рецептов."""
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    duplicates = Favorite.objects.order_by().values(
+        'user', 'recipe'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    recipe_ids = set()
+    for group in duplicates.iterator():
+        Favorite.objects.filter(
+            user=group['user'], recipe=group['recipe']
+        ).exclude(id=group['keep']).delete()
+        recipe_ids.add(group['recipe'])
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        favorites_count=Coalesce(Subquery(
+            Favorite.objects.filter(recipe=OuterRef('pk')).order_by().values(
+                'recipe'
+            ).annotate(total=Count('id')).values('total')
+        ), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', 'id'], name='recipe_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeingredient',
+            index=models.Index(fields=['recipe', 'ingredient', 'amount'], name='recipeingredient_amount_idx'),
+        ),
+        migrations.RunPython(
+            remove_duplicate_favorites, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_timeline(apps, schema_editor):
+    """Копирует автора и дату рецепта в существующие записи лент."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    db = schema_editor.connection.alias
+    recipe = Recipe.objects.using(db).filter(pk=OuterRef('recipe_id'))
+    TimelineEntry.objects.using(db).update(
+        author_id=Subquery(recipe.values('author_id')[:1]),
+        pub_date=Subquery(recipe.values('pub_date')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0013_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timelineentry',
+            name='author',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='pub_date',
+            field=models.DateTimeField(null=True, verbose_name='Дата публикации'),
+        ),
+        migrations.RunPython(fill_timeline, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='timelineentry',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта'),
+        ),
+        migrations.AlterField(
+            model_name='timelineentry',
+            name='pub_date',
+            field=models.DateTimeField(verbose_name='Дата публикации'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', 'recipe'], name='timeline_user_pub_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-18 21:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_feed_recipe_id_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_updated_at',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Время обработки картинки'),
+        ),
+    ]
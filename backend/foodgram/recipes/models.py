@@ -1,9 +1,86 @@
+from datetime import datetime
+
+from django.contrib.postgres.search import SearchVectorField
+from django.conf import settings
+from django.core.cache import cache
 from django.core.validators import (
     RegexValidator, MinValueValidator, MaxValueValidator
 )
 from django.db import models
+from django.db.models import (Case, Count, F, OuterRef, Subquery, Value,
+                              When, Window)
+from django.db.models.functions import Coalesce, Greatest, RowNumber
+from django.utils import timezone
+
+from users.models import CustomUser, Follow
+
+
+CATALOG_EPOCH = timezone.make_aware(datetime(2000, 1, 1), timezone.utc)
+
+
+class CatalogVersionQuerySet(models.QuerySet):
+
+    def bump(self, *names):
+        for name in names:
+            updated = self.filter(name=name).update(
+                version=F('version') + 1, updated_at=timezone.now()
+            )
+            if not updated:
+                self.get_or_create(name=name, defaults={'version': 1})
+
+    def stamp_annotations(self, *names):
+        """Подзапросы версии и времени изменения справочников для
+        annotate: {'<имя>_version': ..., '<имя>_updated_at': ...}."""
+        annotations = {}
+        for name in names:
+            catalog = self.filter(name=name)
+            annotations[f'{name}_version'] = Coalesce(
+                Subquery(catalog.values('version')[:1]), 0
+            )
+            annotations[f'{name}_updated_at'] = Coalesce(
+                Subquery(catalog.values('updated_at')[:1]),
+                Value(CATALOG_EPOCH, output_field=models.DateTimeField())
+            )
+        return annotations
+
+    def get_stamps(self, *names):
+        """Возвращает {имя: (версия, время изменения)} для справочников."""
+        stamps = {
+            catalog.name: (catalog.version, catalog.updated_at)
+            for catalog in self.filter(name__in=names)
+        }
+        return {
+            name: stamps.get(name, (0, CATALOG_EPOCH)) for name in names
+        }
+
+
+class CatalogVersion(models.Model):
+    """Счётчик изменений справочника для условных GET-запросов."""
+    TAGS = 'tags'
+    INGREDIENTS = 'ingredients'
+
+    name = models.CharField(
+        max_length=50,
+        unique=True,
+        verbose_name='Справочник'
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Версия'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Время изменения'
+    )
+
+    objects = CatalogVersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
 
-from users.models import CustomUser
+    def __str__(self):
+        return f'{self.name}: {self.version}'
 
 
 class Tag(models.Model):
@@ -57,12 +134,92 @@ class Ingredient(models.Model):
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def latest_by_author(self, author_ids, limit=None):
+        """Последние рецепты авторов одним запросом: {id автора: [рецепты]}.
+
+        При ``limit`` у каждого автора берутся первые ``limit`` рецептов
+        по ROW_NUMBER() в окне автора.
+        """
+        if not author_ids:
+            return {}
+        recipes = self.filter(author_id__in=author_ids).order_by(
+            '-pub_date', '-id'
+        )
+        if limit is not None:
+            ranked = recipes.annotate(row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            ))
+            sql, params = ranked.query.sql_with_params()
+            recipes = self.model.objects.raw(
+                f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+                f'ORDER BY pub_date DESC, id DESC',
+                (*params, limit)
+            )
+        by_author = {author_id: [] for author_id in author_ids}
+        for recipe in recipes:
+            by_author[recipe.author_id].append(recipe)
+        return by_author
+
+    def change_count(self, field, recipe_ids, delta):
+        """Атомарно меняет счётчик ``field`` рецептов на ``delta``."""
+        return self.filter(id__in=recipe_ids).update(
+            **{field: Greatest(F(field) + delta, 0)}
+        )
+
+    def with_actual_counts(self):
+        """Добавляет пересчитанные по таблицам значения счётчиков."""
+        return self.annotate(
+            actual_favorites_count=count_by_recipe(Favorite),
+            actual_in_carts_count=count_by_recipe(ShoppingCart),
+        )
+
+    def recount(self):
+        """Пересчитывает счётчики рецептов выборки одним UPDATE."""
+        return self.update(
+            favorites_count=count_by_recipe(Favorite),
+            in_carts_count=count_by_recipe(ShoppingCart),
+        )
+
+
+def count_by_recipe(model):
+    """Подзапрос с числом строк ``model`` у рецепта из внешнего запроса."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+                'recipe'
+            ).annotate(total=Count('id')).values('total')
+        ),
+        0
+    )
+
+
 class Recipe(models.Model):
+    IMAGE_PENDING = 'pending'
+    IMAGE_PROCESSING = 'processing'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUSES = (
+        (IMAGE_PENDING, 'Ожидает обработки'),
+        (IMAGE_PROCESSING, 'Обрабатывается'),
+        (IMAGE_READY, 'Готова'),
+        (IMAGE_FAILED, 'Ошибка обработки'),
+    )
+
     name = models.CharField(
         max_length=200,
         verbose_name='Название'
@@ -80,6 +237,24 @@ class Recipe(models.Model):
         upload_to='images/',
         verbose_name='Картинка'
     )
+    image_status = models.CharField(
+        max_length=20,
+        choices=IMAGE_STATUSES,
+        default=IMAGE_PENDING,
+        verbose_name='Состояние обработки картинки'
+    )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Уменьшенные копии картинки'
+    )
+    # pub_date не меняется при фоновой обработке картинки, а ответ с
+    # рецептом меняется: это время входит в Last-Modified.
+    image_updated_at = models.DateTimeField(
+        null=True,
+        editable=False,
+        verbose_name='Время обработки картинки'
+    )
     author = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
@@ -97,15 +272,79 @@ class Recipe(models.Model):
         related_name='tags',
         verbose_name='Список тегов'
     )
+    # Заполняется триггером PostgreSQL из name и text.
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    # Меняются только через RecipeQuerySet.change_count.
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах'
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    COUNTER_FIELDS = ('favorites_count', 'in_carts_count')
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            # Общий список: ORDER BY pub_date DESC, id.
+            models.Index(
+                fields=('-pub_date', 'id'),
+                name='recipe_pub_date_idx'
+            ),
+            # Фильтр по автору, подписки и лента: последние рецепты автора.
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-pub_date', '-id'),
+                name='recipe_favorites_count_idx'
+            ),
+            # Рецепты популярных авторов в ленте: ORDER BY id DESC.
+            models.Index(
+                fields=('author', '-id'),
+                name='recipe_author_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Счётчики могли измениться после чтения рецепта: обычное
+        # сохранение не должно затирать их старыми значениями.
+        # Отложенные поля не загружены: как и Django для таких объектов,
+        # сохраняем только загруженные, иначе каждое поле из списка
+        # подгрузилось бы отдельным запросом.
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+    def get_ingredient_amounts(self):
+        return dict(
+            self.recipeingredient_set.values_list('ingredient_id', 'amount')
+        )
+
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
@@ -132,6 +371,14 @@ class RecipeIngredient(models.Model):
                 name='unique_ingredient_amount'
             )
         ]
+        indexes = [
+            # Покрывающий: количества ингредиентов рецептов для списков
+            # покупок читаются из индекса без обращения к таблице.
+            models.Index(
+                fields=('recipe', 'ingredient', 'amount'),
+                name='recipeingredient_amount_idx'
+            ),
+        ]
 
     def __str__(self):
         return (f'{self.recipe.name}: '
@@ -158,6 +405,12 @@ class Favorite(models.Model):
         ordering = ('id',)
         verbose_name = 'Рецепт в избранном'
         verbose_name_plural = 'Рецепт в избранном'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в избранное.'
@@ -189,3 +442,200 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в корзину.'
+
+
+class ShoppingCartIngredientQuerySet(models.QuerySet):
+
+    def apply(self, user_ids, amounts):
+        """Прибавляет к итогам пользователей количества ингредиентов.
+
+        ``amounts`` - словарь {id ингредиента: изменение количества},
+        изменение может быть отрицательным. Строки с нулевым итогом
+        удаляются.
+        """
+        user_ids = list(user_ids)
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not user_ids or not amounts:
+            return
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids for ingredient_id in amounts
+            ],
+            ignore_conflicts=True
+        )
+        rows = self.filter(user_id__in=user_ids, ingredient_id__in=amounts)
+        rows.update(amount=F('amount') + Case(
+            *[
+                When(ingredient_id=ingredient_id, then=Value(amount))
+                for ingredient_id, amount in amounts.items()
+            ],
+            output_field=models.IntegerField()
+        ))
+        rows.filter(amount__lte=0).delete()
+
+    def add_recipe(self, user, recipe):
+        self.apply([user.id], recipe.get_ingredient_amounts())
+
+    def remove_recipe(self, user, recipe):
+        amounts = recipe.get_ingredient_amounts()
+        self.apply([user.id], {key: -value for key, value in amounts.items()})
+
+    def get_recipes_amounts(self, recipe_ids):
+        return dict(
+            RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values('ingredient_id').annotate(
+                total=models.Sum('amount')
+            ).order_by().values_list('ingredient_id', 'total')
+        )
+
+    def add_recipes(self, user, recipe_ids):
+        self.apply([user.id], self.get_recipes_amounts(recipe_ids))
+
+    def remove_recipes(self, user, recipe_ids):
+        amounts = self.get_recipes_amounts(recipe_ids)
+        self.apply([user.id], {key: -value for key, value in amounts.items()})
+
+
+class ShoppingCartIngredient(models.Model):
+    """Итоговое количество ингредиента в списке покупок пользователя.
+
+    Поддерживается при изменении корзины и рецептов в ней,
+    пересобирается командой rebuild_shopping_lists.
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(
+        default=0,
+        verbose_name='Количество'
+    )
+
+    objects = ShoppingCartIngredientQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shoppingcart_ingredient'
+            )
+        ]
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Список покупок'
+
+    def __str__(self):
+        return (f'{self.user}: {self.ingredient.name} - '
+                f'{self.amount} {self.ingredient.measurement_unit}')
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+    POPULAR_AUTHORS_KEY = 'feed-popular-authors'
+
+    def popular_authors(self):
+        """id авторов, рецепты которых не раскладываются по лентам, а
+        подмешиваются при чтении.
+
+        Группировка всех подписок пересчитывается не чаще раза в
+        ``FEED_POPULAR_AUTHORS_TIMEOUT`` секунд; раскладка и чтение
+        ленты пользуются одним и тем же набором.
+        """
+        return cache.get_or_set(
+            self.POPULAR_AUTHORS_KEY,
+            lambda: frozenset(Follow.objects.order_by().values(
+                'author'
+            ).annotate(
+                followers=models.Count('id')
+            ).filter(
+                followers__gt=settings.FEED_FANOUT_LIMIT
+            ).values_list('author', flat=True)),
+            settings.FEED_POPULAR_AUTHORS_TIMEOUT
+        )
+
+    def is_popular(self, author_id):
+        return author_id in self.popular_authors()
+
+    def fan_out(self, recipe):
+        """Добавляет новый рецепт в ленты подписчиков автора."""
+        if self.is_popular(recipe.author_id):
+            return
+        followers = Follow.objects.filter(
+            author_id=recipe.author_id
+        ).values_list('user_id', flat=True)
+        self.bulk_create(
+            (self.model(user_id=user_id, recipe=recipe,
+                        author_id=recipe.author_id)
+             for user_id in followers.iterator()),
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+
+    def backfill(self, user, author_ids):
+        """Заполняет ленту последними рецептами новых авторов."""
+        recipes = Recipe.objects.only(
+            'id', 'author', 'pub_date'
+        ).latest_by_author(
+            author_ids, settings.FEED_BACKFILL_SIZE
+        )
+        self.bulk_create(
+            [self.model(user=user, recipe_id=recipe.id,
+                        author_id=recipe.author_id)
+             for author_recipes in recipes.values()
+             for recipe in author_recipes],
+            ignore_conflicts=True
+        )
+
+    def prune(self, user, author_ids):
+        self.filter(user=user, author_id__in=author_ids).delete()
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Рецепт'
+    )
+    # Копия автора рецепта: отписка чистит ленту без обращения к рецептам.
+    author = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта'
+    )
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Индекс ограничения задаёт и порядок ленты:
+            # WHERE user_id = ... ORDER BY recipe_id DESC.
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry'
+            )
+        ]
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
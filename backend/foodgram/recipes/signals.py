@@ -0,0 +1,94 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import (RecipeIngredient, ShoppingCart,
+                     ShoppingCartIngredient)
+
+_updated_by_caller = ContextVar('shopping_lists_updated_by_caller',
+                                default=False)
+
+
+@contextmanager
+def shopping_lists_updated_by_caller():
+    """Внутри блока итоги списков покупок пересчитывает вызывающий код
+    (одним запросом на пачку), и сигналы ниже их не трогают."""
+    token = _updated_by_caller.set(True)
+    try:
+        yield
+    finally:
+        _updated_by_caller.reset(token)
+
+
+def apply_to_recipe(recipe_id, amounts):
+    """Меняет итоги всех пользователей, у которых рецепт в корзине."""
+    ShoppingCartIngredient.objects.apply(
+        ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user_id', flat=True),
+        amounts
+    )
+
+
+def apply_to_user(user_id, recipe_id, sign):
+    amounts = ShoppingCartIngredient.objects.get_recipes_amounts([recipe_id])
+    ShoppingCartIngredient.objects.apply(
+        [user_id], {key: sign * value for key, value in amounts.items()}
+    )
+
+
+# Админка и ORM меняют корзины и ингредиенты рецептов по одной строке.
+# Каждый обработчик читает текущее состояние базы, поэтому каскадное
+# удаление рецепта даёт верные итоги при любом порядке удаления его
+# ингредиентов и строк корзин.
+
+@receiver(pre_save, sender=ShoppingCart)
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_previous(sender, instance, **kwargs):
+    instance._previous = None
+    if instance.pk is not None and not _updated_by_caller.get():
+        instance._previous = sender.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_cart_recipe(instance, **kwargs):
+    if _updated_by_caller.get():
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        if (previous.user_id, previous.recipe_id) == (
+                instance.user_id, instance.recipe_id):
+            return
+        apply_to_user(previous.user_id, previous.recipe_id, -1)
+    apply_to_user(instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_cart_recipe(instance, **kwargs):
+    if not _updated_by_caller.get():
+        apply_to_user(instance.user_id, instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def change_recipe_ingredient(instance, **kwargs):
+    if _updated_by_caller.get():
+        return
+    changes = defaultdict(Counter)
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        changes[previous.recipe_id][previous.ingredient_id] -= previous.amount
+    changes[instance.recipe_id][instance.ingredient_id] += instance.amount
+    for recipe_id, amounts in changes.items():
+        apply_to_recipe(recipe_id, amounts)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def remove_recipe_ingredient(instance, **kwargs):
+    if not _updated_by_caller.get():
+        apply_to_recipe(
+            instance.recipe_id, {instance.ingredient_id: -instance.amount}
+        )
+
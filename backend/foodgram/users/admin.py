@@ -1,19 +1,22 @@
 from django.contrib import admin
 
+from recipes.admin_tools import LargeTableAdmin
+
 from .models import CustomUser, Follow
 
 
-class CustomUserAdmin(admin.ModelAdmin):
+class CustomUserAdmin(LargeTableAdmin):
     model = CustomUser
     list_display = ['id', 'email', 'username', 'first_name', 'last_name']
-    list_filter = ('email', 'username')
     search_fields = ('email', 'username')
     empty_value_display = '-empty-'
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     model = Follow
     list_display = ("pk", "user", "author")
+    list_select_related = ("user", "author")
+    raw_id_fields = ("user", "author")
     empty_value_display = '-empty-'
 
 
@@ -68,3 +68,7 @@ class Follow(models.Model):
                 name='unique_followings'
             ),
         ]
+        indexes = [
+            # Страница подписок: подписки пользователя по убыванию id.
+            models.Index(fields=('user', '-id'), name='follow_user_id_idx'),
+        ]
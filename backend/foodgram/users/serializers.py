@@ -1,15 +1,28 @@
 from djoser.serializers import (
     UserCreateSerializer, UserSerializer
 )
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, exceptions
 from rest_framework.validators import UniqueValidator
 
+from api.fields import RecipeImageField, RecipeImageSrcsetField
 from recipes.models import Recipe
 from .models import Follow, CustomUser
 
 User = CustomUser
 
+RECIPE_SHORT_FIELDS = (
+    'id', 'name', 'image', 'image_variants', 'cooking_time', 'author_id',
+    'pub_date'
+)
+
+
+def get_recipes_limit(request):
+    try:
+        limit = int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return max(limit, 0)
+
 
 class CustomUserCreateSerializer(UserCreateSerializer):
     """Сериализатор для создания пользователя."""
@@ -48,6 +61,8 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -55,11 +70,13 @@ class CustomUserSerializer(UserSerializer):
 
 
 class SubscribeRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    """Краткий сериализатор рецепта для подписок."""
+    image = RecipeImageField(default_size='small')
+    image_srcset = RecipeImageSrcsetField()
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -79,9 +96,8 @@ class FollowSerializer(serializers.ModelSerializer):
                   'is_subscribed', 'recipes', 'recipes_count')
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user=obj.user, author=obj.author
-        ).exists()
+        # Сериализуется сама подписка, поэтому пользователь подписан.
+        return True
 
     def validate_subscription(self, subscription):
         if self.context.get('request').method == 'POST':
@@ -90,12 +106,18 @@ class FollowSerializer(serializers.ModelSerializer):
             return subscription
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
-        return SubscribeRecipeSerializer(queryset, many=True).data
+        recipes = self.context.get('recipes')
+        if recipes is None:
+            recipes = Recipe.objects.only(
+                *RECIPE_SHORT_FIELDS
+            ).latest_by_author(
+                [obj.author_id], get_recipes_limit(self.context['request'])
+            )
+        return SubscribeRecipeSerializer(
+            recipes[obj.author_id], many=True, context=self.context
+        ).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj.author).count()
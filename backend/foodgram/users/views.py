@@ -1,3 +1,5 @@
+from django.db import transaction
+from django.db.models import Count
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets, exceptions
@@ -5,8 +7,12 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from api.batch import batch_relation, lock_user
+from recipes.models import Recipe, TimelineEntry
 from .models import Follow, CustomUser
-from .serializers import FollowSerializer
+from .serializers import (
+    RECIPE_SHORT_FIELDS, FollowSerializer, get_recipes_limit
+)
 from rest_framework.pagination import PageNumberPagination
 
 
@@ -33,7 +39,10 @@ class FollowViewSet(UserViewSet):
                     'errors': 'Вы уже подписаны на пользователя'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            follow = Follow.objects.create(user=user, author=author)
+            with transaction.atomic():
+                lock_user(user)
+                follow = Follow.objects.create(user=user, author=author)
+                TimelineEntry.objects.backfill(user, [author.id])
             serializer = FollowSerializer(
                 follow, context={'request': request}
             )
@@ -48,16 +57,43 @@ class FollowViewSet(UserViewSet):
                 return Response({
                     'errors': 'Вы уже отписались'
                 }, status=status.HTTP_400_BAD_REQUEST)
-            follow.delete()
+            with transaction.atomic():
+                lock_user(user)
+                follow.delete()
+                TimelineEntry.objects.prune(user, [author.id])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='subscribe',
+        url_name='subscribe-batch',
+        permission_classes=(IsAuthenticated,))
+    def subscribe_batch(self, request):
+        return batch_relation(
+            request, Follow, User, 'author',
+            on_added=TimelineEntry.objects.backfill,
+            on_removed=TimelineEntry.objects.prune,
+            rejected={request.user.id}
+        )
+
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         user = request.user
-        queryset = Follow.objects.filter(user=user)
+        queryset = Follow.objects.filter(user=user).select_related(
+            'author'
+        ).annotate(
+            recipes_count=Count('author__author')
+        ).order_by('-id')
         pages = self.paginate_queryset(queryset)
+        recipes = Recipe.objects.only(
+            *RECIPE_SHORT_FIELDS
+        ).latest_by_author(
+            [follow.author_id for follow in pages],
+            get_recipes_limit(request)
+        )
         serializer = FollowSerializer(
             pages,
             many=True,
-            context={'request': request})
+            context={'request': request, 'recipes': recipes})
         return self.get_paginated_response(serializer.data)